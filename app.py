@@ -1,12 +1,8 @@
 import streamlit as st
-from story_generator import (
-    categorize_request,
-    generate_story,
-    length_instruction,
-    arc_instruction,
-    category_instruction
-)
-from story_improviser import judge_and_improve_story, revise_story, JudgeFeedback
+from story_improviser import JudgeFeedback
+from story_pipeline import run_story, run_series_episode, run_revision, format_timings
+from story_archive import get_archive, timings_by_stage
+from revision_tree import RevisionTree
 
 # Page configuration
 st.set_page_config(
@@ -35,6 +31,25 @@ if "arc_display_saved" not in st.session_state:
     st.session_state.arc_display_saved = None
 if "judge_feedbacks" not in st.session_state:
     st.session_state.judge_feedbacks = []
+if "pipeline_timings" not in st.session_state:
+    st.session_state.pipeline_timings = ""
+if "archive_id" not in st.session_state:
+    st.session_state.archive_id = None
+# Every version of the current story, so undo/redo and repeated feedback need no new model call
+if "revision_tree" not in st.session_state:
+    st.session_state.revision_tree = None
+if "series_episode" not in st.session_state:
+    st.session_state.series_episode = None
+
+
+def show_tree_version(move):
+    """Undo/redo callback: move within the revision tree and show that version."""
+    story = move()
+    st.session_state.final_story = story
+    archive = get_archive()
+    if archive is not None and st.session_state.archive_id is not None:
+        archive.update_story(st.session_state.archive_id, story)
+
 
 # ---------- Sidebar: Story Settings ----------
 with st.sidebar:
@@ -68,6 +83,27 @@ with st.sidebar:
     )
     arc_choice = arc_options[arc_display]
 
+    drafting_mode = st.radio(
+        "Drafting mode",
+        options=["Draft, judge and rewrite", "Best of several drafts"],
+        help="'Best of several drafts' writes a few drafts at once and keeps the best one, which is usually faster"
+    )
+    best_of_n = 0
+    if drafting_mode == "Best of several drafts":
+        best_of_n = st.slider("Number of drafts", min_value=2, max_value=5, value=3)
+
+    screen_while_writing = st.checkbox(
+        "Screen the draft for safety while it is written",
+        value=False,
+        help="Checks each paragraph as it is generated and restarts the draft early if anything unsuitable appears"
+    )
+
+    series_name = st.text_input(
+        "Series name (optional)",
+        placeholder="e.g., 'Pip the dragon'",
+        help="Stories with the same series name continue over several nights with the same characters and places"
+    ).strip()
+
 st.markdown("---")
 
 # ---------- Story Request Input ----------
@@ -86,29 +122,45 @@ if st.button("✨ Generate Story", type="primary", use_container_width=True):
         # Save request for future revisions
         st.session_state.user_request = user_request
 
-        # Step 1: Categorize request
-        with st.spinner("Detecting story category..."):
-            category = categorize_request(user_request)
-            st.session_state.category = category
+        # Categorize -> draft -> judge panel (concurrently) -> rewrite
+        with st.spinner("Writing your story and evaluating it with our judge panel (Safety, Narrative, Emotional Tone, Parent-Intent)..."):
+            if series_name:
+                result = run_series_episode(series_name, user_request, length_choice, arc_choice)
+            else:
+                result = run_story(user_request, length_choice, arc_choice, screen_while_writing, best_of_n)
 
+        category = result["category"]
+        st.session_state.category = category
         st.info(f"📚 Detected category: **{category.replace('_', ' ').title()}**")
+        if series_name:
+            st.session_state.series_episode = f"{series_name}, episode {result['updated_bible'].episodes}"
+        else:
+            st.session_state.series_episode = None
 
-        # Step 2: Generate draft story
-        with st.spinner("Generating your bedtime story draft..."):
-            draft_story = generate_story(user_request, length_choice, arc_choice, category)
-
-        # Step 3: Judge panel evaluation and improvement
-        arc_description = arc_instruction(arc_choice)
-        with st.spinner("Evaluating the story with our judge panel (Safety, Narrative, Emotional Tone, Parent-Intent)..."):
-            final_story, judge_feedbacks = judge_and_improve_story(user_request, draft_story, arc_choice, arc_description)
+        screening = result.get("screening")
+        if screening is not None and screening.aborted_reasons:
+            st.warning(
+                f"🛡️ Safety screening restarted the draft {len(screening.aborted_reasons)} time(s): "
+                + "; ".join(screening.aborted_reasons)
+            )
 
         # Persist in session state
-        st.session_state.final_story = final_story
-        st.session_state.judge_feedbacks = judge_feedbacks
+        st.session_state.final_story = result["final_story"]
+        st.session_state.judge_feedbacks = result["judge_feedbacks"]
+        st.session_state.pipeline_timings = format_timings(result)
+        st.session_state.revision_tree = RevisionTree(result["final_story"])
         st.session_state.story_generated = True
         st.session_state.length_display_saved = length_display
         st.session_state.arc_display_saved = arc_display
 
+        # Keep a persistent copy beyond this session
+        archive = get_archive()
+        if archive is not None:
+            st.session_state.archive_id = archive.add_story(
+                user_request, length_choice, arc_choice, category,
+                result["final_story"], result["judge_feedbacks"], timings_by_stage(result)
+            )
+
         st.success("Story generated successfully! ✨")
 
 # ---------- Display Generated Story + Revision ----------
@@ -210,6 +262,11 @@ if st.session_state.story_generated and st.session_state.final_story:
                 "Category",
                 st.session_state.category.replace("_", " ").title() if st.session_state.category else "N/A"
             )
+        if st.session_state.series_episode:
+            st.markdown(f"**Series:** {st.session_state.series_episode}")
+        if st.session_state.pipeline_timings:
+            st.markdown("**Pipeline timings**")
+            st.code(st.session_state.pipeline_timings)
     
     st.markdown("---")
     st.subheader("💬 Want to make changes?")
@@ -228,19 +285,41 @@ if st.session_state.story_generated and st.session_state.final_story:
         
         if submitted:
             if feedback and feedback.strip():
+                tree = st.session_state.revision_tree
                 with st.spinner("Applying your feedback and revising the story..."):
-                    revised_story = revise_story(
-                        st.session_state.user_request,
-                        st.session_state.final_story,
-                        feedback.strip()
+                    revised_story, from_history = tree.revise(
+                        feedback.strip(),
+                        lambda story, change: run_revision(st.session_state.user_request, story, change)["revised_story"]
                     )
                     st.session_state.final_story = revised_story
+                    archive = get_archive()
+                    if archive is not None and st.session_state.archive_id is not None:
+                        archive.update_story(st.session_state.archive_id, revised_story)
 
+                if from_history:
+                    st.info("♻️ You already tried this change, so here is that version again.")
                 st.success("Story revised successfully! ✨")
                 # No rerun needed: the updated story is already in session_state
             else:
                 st.warning("Please enter feedback to revise the story.")
     
+    # ---------- Undo / Redo ----------
+    tree = st.session_state.revision_tree
+    if tree is not None:
+        undo_col, redo_col = st.columns(2)
+        with undo_col:
+            st.button(
+                "↩️ Undo Revision", use_container_width=True, key="undo_btn",
+                disabled=not tree.can_undo(), on_click=show_tree_version, args=(tree.undo,)
+            )
+        with redo_col:
+            st.button(
+                "↪️ Redo Revision", use_container_width=True, key="redo_btn",
+                disabled=not tree.can_redo(), on_click=show_tree_version, args=(tree.redo,)
+            )
+        if tree.history():
+            st.caption("Changes applied: " + " → ".join(tree.history()))
+    
     # ---------- New Story button ----------
     if st.button("🆕 Generate New Story", use_container_width=True, key="new_story_btn"):
         st.session_state.story_generated = False
@@ -250,6 +329,10 @@ if st.session_state.story_generated and st.session_state.final_story:
         st.session_state.length_display_saved = None
         st.session_state.arc_display_saved = None
         st.session_state.judge_feedbacks = []
+        st.session_state.pipeline_timings = ""
+        st.session_state.archive_id = None
+        st.session_state.revision_tree = None
+        st.session_state.series_episode = None
     
     # ---------- Download button ----------
     st.download_button(
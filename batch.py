@@ -0,0 +1,110 @@
+"""
+Batch runner: generate many stories with the same graph the CLI and Streamlit app use.
+
+Input is JSONL, one job per line:
+    {"request": "A shy dragon who learns to be brave", "length": "short", "arc": "confidence_overcoming_fear"}
+"length" defaults to "medium" and "arc" to "calming_bedtime".
+Output is JSONL with the final story, the judge scorecard and per-stage timings.
+Successful stories are also added to the story archive, in batches.
+"""
+import sys
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List
+
+from story_pipeline import run_story
+from scheduler import priority, get_scheduler, BATCH
+from story_improviser import JudgeFeedback
+from story_archive import get_archive
+
+
+def read_jobs(path: str) -> List[Dict]:
+    jobs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                jobs.append(json.loads(line))
+    return jobs
+
+
+def run_job(job: Dict, screen_while_writing: bool = False, best_of_n: int = 0) -> Dict:
+    """Run one job through the story graph and return a JSON-serializable record."""
+    length_choice = job.get("length", "medium")
+    arc_choice = job.get("arc", "calming_bedtime")
+    try:
+        # Batch work only soaks up capacity that interactive users are not using
+        with priority(BATCH):
+            result = run_story(job["request"], length_choice, arc_choice, screen_while_writing, best_of_n)
+    except Exception as e:
+        return {"request": job.get("request"), "length": length_choice, "arc": arc_choice, "error": str(e)}
+    return {
+        "request": job["request"],
+        "length": length_choice,
+        "arc": arc_choice,
+        "category": result["category"],
+        "final_story": result["final_story"],
+        "judge_feedbacks": [feedback.to_dict() for feedback in result["judge_feedbacks"]],
+        "timings": [timing.to_dict() for timing in result.timings],
+        "total_seconds": round(result.total_seconds, 3),
+    }
+
+
+def archive_record(record: Dict) -> Dict:
+    """Convert a successful output record into the form StoryArchive.add_many expects."""
+    return {
+        "request": record["request"],
+        "length": record["length"],
+        "arc": record["arc"],
+        "category": record["category"],
+        "story": record["final_story"],
+        "judge_feedbacks": [JudgeFeedback.from_dict(feedback) for feedback in record["judge_feedbacks"]],
+        "timings": {timing["name"]: timing["seconds"] for timing in record["timings"]},
+    }
+
+
+def run_batch(jobs: List[Dict], workers: int = 4, screen_while_writing: bool = False,
+              best_of_n: int = 0) -> Iterator[Dict]:
+    """Run jobs concurrently, yielding records in input order."""
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(lambda job: run_job(job, screen_while_writing, best_of_n), jobs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate bedtime stories in bulk.")
+    parser.add_argument("input", help="JSONL file of story jobs")
+    parser.add_argument("output", help="JSONL file to write results to")
+    parser.add_argument("--workers", type=int, default=4, help="stories to generate concurrently")
+    parser.add_argument("--screen", action="store_true", help="screen drafts for safety while they are written")
+    parser.add_argument("--best-of", type=int, default=0, help="write N drafts per story and keep the best")
+    parser.add_argument("--archive-batch", type=int, default=50, help="stories per archive insert transaction")
+    args = parser.parse_args()
+
+    jobs = read_jobs(args.input)
+    archive = get_archive()
+    to_archive: List[Dict] = []
+    failed = 0
+    with open(args.output, "w", encoding="utf-8") as out:
+        for done, record in enumerate(run_batch(jobs, args.workers, args.screen, args.best_of), start=1):
+            failed += "error" in record
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            print(f"[{done}/{len(jobs)}] {(record['request'] or '')[:60]}", file=sys.stderr)
+            if archive is not None and "error" not in record:
+                to_archive.append(archive_record(record))
+                if len(to_archive) >= args.archive_batch:
+                    archive.add_many(to_archive)
+                    to_archive = []
+    if archive is not None and to_archive:
+        archive.add_many(to_archive)
+    print(f"Done: {len(jobs) - failed} stories written to {args.output}, {failed} failed.", file=sys.stderr)
+    batch_metrics = get_scheduler().metrics()[BATCH]
+    print(
+        f"Batch model calls: {batch_metrics['admitted']} admitted, {batch_metrics['rejected']} rejected, "
+        f"wait p50 {batch_metrics['wait_p50_s']}s / p95 {batch_metrics['wait_p95_s']}s",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
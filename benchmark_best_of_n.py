@@ -0,0 +1,73 @@
+"""
+Benchmark: story quality vs. latency for best-of-N drafting, against the serial
+draft -> judge -> rewrite pipeline.
+
+For every request and every mode, the story is generated through the same graphs the apps use
+(timed), then the final story is scored by the judge panel and the local scorer (untimed),
+so both modes are compared on what the user actually receives.
+
+Run against live traffic, or offline with a cassette:
+    STORY_CASSETTE_MODE=record STORY_CASSETTE_PATH=bench.jsonl python benchmark_best_of_n.py
+    STORY_CASSETTE_MODE=replay STORY_CASSETTE_PATH=bench.jsonl STORY_CASSETTE_REALTIME=1 python benchmark_best_of_n.py
+"""
+import argparse
+import statistics
+from typing import Dict, List
+
+from story_pipeline import run_story
+from story_improviser import judge_panel_evaluation
+from story_generator import arc_instruction
+from best_of_n import score_draft
+
+SAMPLE_JOBS = [
+    ("A shy dragon who learns to be brave at the school play", "short", "confidence_overcoming_fear"),
+    ("A little owl who cannot fall asleep", "short", "calming_bedtime"),
+    ("Two squirrels who both want the last acorn", "medium", "friendship_cooperation"),
+    ("A girl who wonders where the moon goes in the daytime", "medium", "curiosity_learning"),
+]
+
+
+def mean_judge_score(user_request: str, story: str, arc_choice: str) -> float:
+    feedbacks = judge_panel_evaluation(user_request, story, arc_choice, arc_instruction(arc_choice))
+    scores = [score for feedback in feedbacks for score in feedback.scores.values()]
+    return statistics.mean(scores) if scores else 0.0
+
+
+def benchmark_mode(label: str, best_of_n: int, jobs: List[tuple]) -> Dict:
+    latencies, judge_scores, local_scores = [], [], []
+    for user_request, length_choice, arc_choice in jobs:
+        result = run_story(user_request, length_choice, arc_choice, best_of_n=best_of_n)
+        latencies.append(result.total_seconds)
+        story = result["final_story"]
+        judge_scores.append(mean_judge_score(user_request, story, arc_choice))
+        local_scores.append(score_draft(story, length_choice, arc_choice).total)
+    return {
+        "mode": label,
+        "latency_mean_s": statistics.mean(latencies),
+        "latency_max_s": max(latencies),
+        "judge_mean": statistics.mean(judge_scores),
+        "local_mean": statistics.mean(local_scores),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark best-of-N drafting against draft-judge-rewrite.")
+    parser.add_argument("--max-n", type=int, default=5, help="largest number of drafts to try")
+    parser.add_argument("--jobs", type=int, default=len(SAMPLE_JOBS), help="how many sample requests to use")
+    args = parser.parse_args()
+
+    jobs = SAMPLE_JOBS[:args.jobs]
+    rows = [benchmark_mode("draft-judge-rewrite", 0, jobs)]
+    for n in range(2, args.max_n + 1):
+        rows.append(benchmark_mode(f"best-of-{n}", n, jobs))
+
+    print(f"{'mode':<22}{'latency mean':>14}{'latency max':>13}{'judge mean':>12}{'local mean':>12}")
+    for row in rows:
+        print(
+            f"{row['mode']:<22}{row['latency_mean_s']:>13.2f}s{row['latency_max_s']:>12.2f}s"
+            f"{row['judge_mean']:>12.2f}{row['local_mean']:>12.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+from story_generator import generate_story
+from safety_screening import lexicon_hits
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+import contextvars
+import re
+
+# Target word counts for each length choice (matches length_instruction)
+LENGTH_TARGETS = {
+    "short": (300, 500),
+    "medium": (600, 900),
+    "long": (1000, 1300),
+}
+
+# Words that signal a draft is actually delivering the parent's chosen arc
+ARC_KEYWORDS = {
+    "confidence_overcoming_fear": ["afraid", "scared", "brave", "courage", "try", "proud", "safe", "step"],
+    "kindness_empathy": ["kind", "help", "feel", "listen", "care", "sad", "share", "hug"],
+    "friendship_cooperation": ["friend", "together", "share", "team", "help", "sorry", "agree", "play"],
+    "curiosity_learning": ["wonder", "question", "why", "discover", "learn", "explore", "curious", "new"],
+    "calming_bedtime": ["sleep", "quiet", "soft", "calm", "cozy", "yawn", "dream", "gentle"],
+    "responsibility_independence": ["try", "practice", "job", "own", "proud", "mistake", "again", "help"],
+    "silly_creative_fun": ["silly", "giggle", "laugh", "funny", "imagine", "wobble", "sleep", "calm"],
+}
+
+# Weights of the local score components (sum to 1)
+SCORE_WEIGHTS = {
+    "length_fit": 0.3,
+    "readability": 0.25,
+    "safety": 0.25,
+    "arc_coverage": 0.15,
+    "has_moral": 0.05,
+}
+
+_WORD = re.compile(r"[A-Za-z']+")
+_SENTENCE_END = re.compile(r"[.!?]+")
+_VOWEL_GROUPS = re.compile(r"[aeiouy]+")
+
+
+class DraftScore:
+    """Local (no model call) quality estimate for one draft."""
+    def __init__(self, temperature: float, components: Dict[str, float]):
+        self.temperature = temperature
+        self.components = components
+        self.total = sum(SCORE_WEIGHTS[name] * value for name, value in components.items())
+
+    def to_dict(self):
+        return {
+            "temperature": self.temperature,
+            "total": round(self.total, 3),
+            "components": {name: round(value, 3) for name, value in self.components.items()},
+        }
+
+
+def _syllables(word: str) -> int:
+    word = word.lower().rstrip("e")
+    return max(1, len(_VOWEL_GROUPS.findall(word)))
+
+
+def length_fit(story: str, length_choice: str) -> float:
+    """1.0 inside the target word range, falling off linearly to 0 at half/double the range."""
+    low, high = LENGTH_TARGETS.get(length_choice, LENGTH_TARGETS["medium"])
+    words = len(_WORD.findall(story))
+    if words < low:
+        return max(0.0, 1 - (low - words) / (low / 2))
+    if words > high:
+        return max(0.0, 1 - (words - high) / high)
+    return 1.0
+
+
+def readability(story: str) -> float:
+    """
+    Flesch-Kincaid grade level mapped to 0..1: grades 1-4 (read-aloud level for ages 5-10)
+    score 1.0, each grade above that costs 0.25.
+    """
+    words = _WORD.findall(story)
+    if not words:
+        return 0.0
+    sentences = max(1, len(_SENTENCE_END.findall(story)))
+    syllables = sum(_syllables(word) for word in words)
+    grade = 0.39 * len(words) / sentences + 11.8 * syllables / len(words) - 15.59
+    return max(0.0, min(1.0, 1 - (grade - 4) * 0.25))
+
+
+def arc_coverage(story: str, arc_choice: str) -> float:
+    """Share of the arc's keywords the story uses; half of them counts as full coverage."""
+    keywords = ARC_KEYWORDS.get(arc_choice)
+    if not keywords:
+        return 1.0
+    words = {word.lower() for word in _WORD.findall(story)}
+    found = sum(1 for keyword in keywords if any(word.startswith(keyword) for word in words))
+    return min(1.0, found / (len(keywords) / 2))
+
+
+def score_draft(story: str, length_choice: str, arc_choice: str, temperature: float = 0.0) -> DraftScore:
+    """Score a draft locally on length fit, readability, safety lexicon, arc keywords and a stated moral."""
+    return DraftScore(temperature, {
+        "length_fit": length_fit(story, length_choice),
+        "readability": readability(story),
+        "safety": 0.0 if lexicon_hits(story) else 1.0,
+        "arc_coverage": arc_coverage(story, arc_choice),
+        "has_moral": 1.0 if "moral" in story.lower() else 0.0,
+    })
+
+
+def draft_temperatures(n: int) -> List[float]:
+    """N temperatures spread evenly over 0.7-1.0 (a single draft uses the usual 0.85)."""
+    if n <= 1:
+        return [0.85]
+    return [round(0.7 + 0.3 * i / (n - 1), 2) for i in range(n)]
+
+
+def generate_best_of_n(
+    user_request: str,
+    length_choice: str,
+    arc_choice: str,
+    category: str,
+    n: int = 3,
+) -> Tuple[str, List[DraftScore]]:
+    """
+    Generate N drafts concurrently at varied temperatures and keep the best one by local score.
+    Drafts that fail are skipped; an error is raised only if all N fail.
+    Returns (best_draft, scores of the drafts that succeeded, best first).
+    """
+    temperatures = draft_temperatures(n)
+    with ThreadPoolExecutor(max_workers=len(temperatures)) as executor:
+        futures = [
+            # Each draft runs under the caller's context so it keeps the caller's priority class
+            executor.submit(contextvars.copy_context().run, generate_story,
+                            user_request, length_choice, arc_choice, category, temperature)
+            for temperature in temperatures
+        ]
+        drafts = []
+        error = None
+        for future, temperature in zip(futures, temperatures):
+            try:
+                drafts.append((future.result(), temperature))
+            except Exception as e:
+                # One failed draft does not cost the others; only fail when none came back
+                error = e
+        if not drafts:
+            raise error
+
+    scored = sorted(
+        ((score_draft(draft, length_choice, arc_choice, temperature), draft) for draft, temperature in drafts),
+        key=lambda pair: pair[0].total,
+        reverse=True,
+    )
+    return (scored[0][1], [score for score, _ in scored])
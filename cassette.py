@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+# Cassette modes
+RECORD = "record"
+REPLAY = "replay"
+
+
+class CassetteMiss(RuntimeError):
+    """Raised in replay mode when a request was never recorded."""
+
+
+class Cassette:
+    """
+    Append-only JSONL log of call_model traffic.
+
+    Each line is one of two record types:
+    - {"p": <hash>, "text": <prompt>}  a prompt, written the first time it is seen
+    - {"k": <key>, "s": <hash>, "u": <hash>, "mt": ..., "temp": ..., "t": ..., "l": ..., "r": <response>}
+      one call, referencing its system/user prompts by hash; streams that were aborted
+      midway also carry "partial": true and are only replayed to stream_model
+
+    Prompts are stored once, so the large, repeated system prompts do not bloat the file.
+    """
+
+    def __init__(self, path: str, mode: str = RECORD, realtime: bool = False):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode: {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.realtime = realtime  # replay only: sleep for the recorded latency
+        self._lock = threading.Lock()
+        self._prompts: Dict[str, str] = {}
+        self._calls: Dict[str, deque] = {}
+        self._last: Dict[tuple, dict] = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            if self.mode == REPLAY:
+                raise FileNotFoundError(f"Cassette not found: {self.path}")
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line)
+                if "p" in entry:
+                    self._prompts[entry["p"]] = entry["text"]
+                elif self.mode == REPLAY:
+                    self._calls.setdefault(entry["k"], deque()).append(entry)
+
+    def _write(self, lines: list):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines))
+
+    def record(self, key: str, system_prompt: str, user_prompt: str, max_tokens: int,
+               temperature: float, response: str, started: float, latency: float, partial: bool = False):
+        """
+        Append one call (and any prompts not yet on disk) to the cassette.
+        partial marks a stream that was aborted before the full response arrived.
+        """
+        lines = []
+        refs = []
+        with self._lock:
+            for prompt in (system_prompt, user_prompt):
+                digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+                if digest not in self._prompts:
+                    self._prompts[digest] = prompt
+                    lines.append({"p": digest, "text": prompt})
+                refs.append(digest)
+            call = {
+                "k": key,
+                "s": refs[0],
+                "u": refs[1],
+                "mt": max_tokens,
+                "temp": temperature,
+                "t": round(started, 3),
+                "l": round(latency, 4),
+                "r": response,
+            }
+            if partial:
+                call["partial"] = True
+            lines.append(call)
+            self._write(lines)
+
+    def replay(self, key: str, include_partial: bool = False) -> str:
+        """
+        Serve the recorded response for a request key.
+        Repeated requests get the recorded responses in order; once those run out
+        the last one is served again. Aborted (partial) streams are skipped unless
+        include_partial is set, so call_model never receives a truncated response.
+        """
+        with self._lock:
+            queue = self._calls.get(key) or ()
+            entry = next((e for e in queue if include_partial or not e.get("partial")), None)
+            if entry is not None:
+                queue.remove(entry)
+                self._last[(key, include_partial)] = entry
+            elif (key, include_partial) in self._last:
+                entry = self._last[(key, include_partial)]
+            else:
+                raise CassetteMiss(f"No recorded response for request {key[:12]} in {self.path}")
+        if self.realtime:
+            time.sleep(entry["l"])
+        return entry["r"]
+
+
+def summarize(path: str) -> dict:
+    """
+    Summarize a cassette: number of calls, unique requests, and recorded latency.
+    Useful as the baseline when replaying the same traffic through new pipeline code.
+    """
+    calls = 0
+    partial = 0
+    keys = set()
+    total_latency = 0.0
+    first = last = None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            if "k" not in entry:
+                continue
+            calls += 1
+            partial += entry.get("partial", False)
+            keys.add(entry["k"])
+            total_latency += entry["l"]
+            first = entry["t"] if first is None else min(first, entry["t"])
+            last = entry["t"] + entry["l"] if last is None else max(last, entry["t"] + entry["l"])
+    return {
+        "calls": calls,
+        "unique_requests": len(keys),
+        "aborted_streams": partial,
+        "total_model_latency_s": round(total_latency, 3),
+        "wall_clock_s": round(last - first, 3) if calls else 0.0,
+    }
+
+
+_active: Optional[Cassette] = None
+_configured = False
+
+
+def use_cassette(path: Optional[str], mode: str = RECORD, realtime: bool = False) -> Optional[Cassette]:
+    """
+    Activate a cassette for all subsequent call_model traffic in this process.
+    Pass path=None to turn recording/replay off.
+    """
+    global _active, _configured
+    _active = Cassette(path, mode, realtime) if path else None
+    _configured = True
+    return _active
+
+
+def get_cassette() -> Optional[Cassette]:
+    """
+    Return the active cassette, configuring it from the environment on first use:
+    STORY_CASSETTE_MODE (record/replay), STORY_CASSETTE_PATH and STORY_CASSETTE_REALTIME=1.
+    """
+    global _configured
+    if not _configured:
+        mode = os.getenv("STORY_CASSETTE_MODE", "").strip().lower()
+        if mode:
+            path = os.getenv("STORY_CASSETTE_PATH", "story_cassette.jsonl")
+            realtime = os.getenv("STORY_CASSETTE_REALTIME", "") == "1"
+            use_cassette(path, mode, realtime)
+        _configured = True
+    return _active
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 2:
+        print("Usage: python cassette.py <cassette.jsonl>")
+        sys.exit(1)
+    for name, value in summarize(sys.argv[1]).items():
+        print(f"{name}: {value}")
@@ -0,0 +1,106 @@
+"""
+Thin client for the story daemon (story_daemon.py).
+
+Deliberately imports nothing but the standard library, so `python main.py` starts
+almost instantly when a warm daemon is running.
+"""
+import os
+import json
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+DEFAULT_SOCKET_PATH = os.path.join(os.path.expanduser("~"), ".story_daemon.sock")
+
+
+def socket_path() -> str:
+    return os.getenv("STORY_DAEMON_SOCKET", DEFAULT_SOCKET_PATH)
+
+
+class DaemonError(RuntimeError):
+    """Raised when the daemon reports that a job failed."""
+
+
+class DaemonClient:
+    """Sends one JSON job per connection over the daemon's Unix domain socket."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or socket_path()
+
+    def _send(self, payload: Dict) -> Dict:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self.path)
+            sock.sendall(json.dumps(payload).encode("utf-8") + b"\n")
+            with sock.makefile("r", encoding="utf-8") as reader:
+                line = reader.readline()
+        if not line:
+            raise DaemonError("The story daemon closed the connection without replying.")
+        reply = json.loads(line)
+        if "error" in reply:
+            raise DaemonError(reply["error"])
+        return reply
+
+    def ping(self) -> bool:
+        try:
+            return self._send({"op": "ping"}).get("ok", False)
+        except (OSError, DaemonError):
+            return False
+
+    def story(self, user_request: str, length_choice: str, arc_choice: str, screen: bool = False,
+              best_of: int = 0, priority: str = "interactive", series: Optional[str] = None) -> Dict:
+        """Generate one story; returns the daemon's story record."""
+        return self._send({
+            "op": "story",
+            "request": user_request,
+            "length": length_choice,
+            "arc": arc_choice,
+            "screen": screen,
+            "best_of": best_of,
+            "priority": priority,
+            "series": series,
+        })
+
+    def revise(self, user_request: str, current_story: str, feedback: str, archive_id: Optional[int] = None) -> Dict:
+        """Revise a story; returns {"revised_story": ...}."""
+        return self._send({
+            "op": "revise",
+            "request": user_request,
+            "story": current_story,
+            "feedback": feedback,
+            "archive_id": archive_id,
+        })
+
+    def stats(self) -> Dict:
+        return self._send({"op": "stats"})
+
+    def submit_many(self, jobs: List[Dict], concurrency: int = 4, priority: str = "batch") -> Iterator[Dict]:
+        """
+        Submit many story jobs to the same warm daemon, `concurrency` at a time.
+        Yields one record per job, in input order; failed jobs, including ones whose connection
+        was lost, yield {"request": ..., "error": ...}.
+        """
+        def submit(job: Dict) -> Dict:
+            if not isinstance(job, dict) or not job.get("request"):
+                # A malformed jobs line only fails that job
+                return {"request": job.get("request") if isinstance(job, dict) else None,
+                        "error": 'Job has no "request"'}
+            try:
+                return self.story(job["request"], job.get("length", "medium"), job.get("arc", "calming_bedtime"),
+                                  job.get("screen", False), job.get("best_of", 0), priority, job.get("series"))
+            except DaemonError as e:
+                return {"request": job.get("request"), "error": str(e)}
+            except (OSError, ValueError) as e:
+                # A dropped connection or a truncated reply (e.g. a daemon restart) only fails this job
+                return {"request": job.get("request"), "error": f"{type(e).__name__}: {e}"}
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            yield from executor.map(submit, jobs)
+
+
+def connect_if_running() -> Optional[DaemonClient]:
+    """Return a client if a daemon is listening on the socket, otherwise None."""
+    path = socket_path()
+    if not os.path.exists(path):
+        return None
+    client = DaemonClient(path)
+    return client if client.ping() else None
@@ -1,5 +1,9 @@
-from story_generator import *
-from story_improviser import *
+from story_generator import ask_length_choice, ask_arc_choice
+from daemon_client import connect_if_running
+import os
+import sys
+import json
+import argparse
 
 """
 Before submitting the assignment, describe here in a few sentences what you would have built next if you spent 2 more hours on this project:
@@ -21,29 +25,48 @@ def main():
     length_choice = ask_length_choice()
     arc_choice = ask_arc_choice()
 
-    print("\nDetecting a high-level category for your request...\n")
-    category = categorize_request(user_request)
-    print(f"Detected category: {category}\n")
+    # Use the warm daemon when one is running; otherwise run the pipeline in this process
+    daemon = connect_if_running()
+    job = {
+        "request": user_request,
+        "length": length_choice,
+        "arc": arc_choice,
+        "screen": os.getenv("STORY_PIPELINED_SAFETY") == "1",
+        "best_of": int(os.getenv("STORY_BEST_OF_N", "0")),
+        # Continue a multi-night series (e.g. STORY_SERIES="Pip the dragon")
+        "series": os.getenv("STORY_SERIES", "").strip() or None,
+    }
 
-    print("Generating your bedtime story draft...\n")
-    draft_story = generate_story(user_request, length_choice, arc_choice, category)
-
-    print("Evaluating the story with our judge panel...\n")
-    from story_generator import arc_instruction
-    arc_description = arc_instruction(arc_choice)
-    final_story, judge_feedbacks = judge_and_improve_story(user_request, draft_story, arc_choice, arc_description)
+    print("\nWriting your bedtime story and evaluating it with our judge panel...\n")
+    if daemon is not None:
+        record = daemon.story(job["request"], job["length"], job["arc"], job["screen"], job["best_of"],
+                              series=job["series"])
+    else:
+        from story_daemon import story_job
+        record = story_job(job)
+    print(f"Detected category: {record['category']}\n")
+    if record.get("series"):
+        print(f"Episode {record['episode']} of the series '{record['series']}'\n")
+    for reason in record["screening_reasons"]:
+        print(f"Safety screening restarted the draft: {reason}")
+    final_story = record["final_story"]
+    judge_feedbacks = record["judge_feedbacks"]
     
     # Display judge scorecard
     print("\n" + "="*60)
     print("JUDGE PANEL SCORECARD")
     print("="*60)
     for feedback in judge_feedbacks:
-        print(f"\n{feedback.judge_name}:")
-        for dimension, score in feedback.scores.items():
+        print(f"\n{feedback['judge_name']}:")
+        for dimension, score in feedback["scores"].items():
             print(f"  {dimension}: {score}/5")
-        print(f"  Feedback: {feedback.feedback}")
+        print(f"  Feedback: {feedback['feedback']}")
     print("="*60 + "\n")
 
+    if os.getenv("STORY_SHOW_TIMINGS") == "1":
+        print("Pipeline timings:")
+        print(record["timings_text"] + "\n")
+
     print("Here is your bedtime story:\n")
     print(final_story)
 
@@ -54,12 +77,52 @@ def main():
 
     if feedback:
         print("\nApplying your feedback and revising the story...\n")
-        revised = revise_story(user_request, final_story, feedback)
+        if daemon is not None:
+            revised = daemon.revise(user_request, final_story, feedback, record["archive_id"])["revised_story"]
+        else:
+            from story_daemon import revise_job
+            revised = revise_job({
+                "request": user_request,
+                "story": final_story,
+                "feedback": feedback,
+                "archive_id": record["archive_id"],
+            })["revised_story"]
         print("Here is your revised bedtime story:\n")
         print(revised)
     else:
         print("\nGreat! Enjoy your bedtime story.")
 
 
+def submit(input_path: str, output_path: str, workers: int):
+    """
+    Send every story in a JSONL jobs file (see batch.py for the format) to the warm daemon.
+    """
+    daemon = connect_if_running()
+    if daemon is None:
+        sys.exit("No story daemon is running. Start one with `python story_daemon.py`, "
+                 "or use `python batch.py` to generate in this process.")
+
+    with open(input_path, "r", encoding="utf-8") as f:
+        jobs = [json.loads(line) for line in f if line.strip()]
+    records = daemon.submit_many(jobs, concurrency=workers)
+
+    failed = 0
+    with open(output_path, "w", encoding="utf-8") as out:
+        for done, record in enumerate(records, start=1):
+            failed += "error" in record
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            print(f"[{done}/{len(jobs)}] {(record.get('request') or '')[:60]}", file=sys.stderr)
+    print(f"Done: {len(jobs) - failed} stories written to {output_path}, {failed} failed.", file=sys.stderr)
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Bedtime Story Generator")
+    parser.add_argument("--submit", nargs=2, metavar=("JOBS", "RESULTS"),
+                        help="generate every story in a JSONL jobs file and write the results as JSONL")
+    parser.add_argument("--workers", type=int, default=4, help="stories to generate concurrently with --submit")
+    args = parser.parse_args()
+
+    if args.submit:
+        submit(args.submit[0], args.submit[1], args.workers)
+    else:
+        main()
\ No newline at end of file
@@ -1,7 +1,75 @@
 import os
-import openai
+import json
+import time
+import hashlib
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Iterator, Optional
 
-def call_model(system_prompt: str, user_prompt: str, max_tokens=3000, temperature=0.1) -> str:
+from cassette import get_cassette, REPLAY
+from shared_state import get_shared_state, estimate_tokens
+from scheduler import get_scheduler, current_priority
+
+MODEL_NAME = "gpt-3.5-turbo"  # do not change this model
+
+def request_key(system_prompt: str, user_prompt: str, max_tokens: int, temperature: float) -> str:
+    """
+    Stable key identifying a call_model request (used by the cassette and the shared cache).
+    """
+    payload = json.dumps([MODEL_NAME, system_prompt, user_prompt, max_tokens, temperature], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+_request_timeout: contextvars.ContextVar = contextvars.ContextVar("request_timeout", default=None)
+
+@contextmanager
+def request_timeout(seconds: Optional[float]) -> Iterator[None]:
+    """
+    Bound every model call made in the enclosed block (per HTTP request, counted from when it is sent).
+    Pipeline stages run under their stage timeout this way.
+    """
+    token = _request_timeout.set(seconds)
+    try:
+        yield
+    finally:
+        _request_timeout.reset(token)
+
+def current_request_timeout() -> Optional[float]:
+    return _request_timeout.get()
+
+_openai_lock = threading.Lock()
+_openai = None
+
+def get_openai():
+    """
+    Import and configure the openai module on first use.
+    The import is deferred so CLI start-up (and the thin daemon client) stays fast.
+    openai keeps one session per thread and recycles it periodically by closing it, so it is
+    given a session factory rather than one shared session: each new session gets a connection
+    pool sized for the concurrent judge calls and keeps openai's own connection retries.
+    """
+    global _openai
+    if _openai is None:
+        with _openai_lock:
+            if _openai is None:
+                import openai
+                import requests
+                from openai import api_requestor
+                from requests.adapters import HTTPAdapter
+
+                max_retries = getattr(api_requestor, "MAX_CONNECTION_RETRIES", 2)
+
+                def make_session() -> requests.Session:
+                    session = requests.Session()
+                    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=max_retries))
+                    return session
+
+                openai.requestssession = make_session
+                _openai = openai
+    return _openai
+
+def _create_completion(system_prompt: str, user_prompt: str, max_tokens: int, temperature: float, stream: bool):
+    openai = get_openai()
     openai.api_key = os.getenv("OPENAI_API_KEY")
     if not openai.api_key:
         raise RuntimeError("OPENAI_API_KEY environment variable is not set.")
@@ -11,13 +79,126 @@ def call_model(system_prompt: str, user_prompt: str, max_tokens=3000, temperatur
         {"role": "user", "content": user_prompt}
     ]
 
-    resp = openai.ChatCompletion.create(
-        model="gpt-3.5-turbo",   # do not change this model
+    # The request timeout (a pipeline stage's timeout) bounds the HTTP request itself, so a timed-out
+    # attempt is really stopped rather than left running in the background
+    return openai.ChatCompletion.create(
+        model=MODEL_NAME,
         messages=messages,
-        stream=False,
+        stream=stream,
         max_tokens=max_tokens,
         temperature=temperature,
+        request_timeout=current_request_timeout(),
     )
+
+def _call_openai(system_prompt: str, user_prompt: str, max_tokens: int, temperature: float) -> str:
+    resp = _create_completion(system_prompt, user_prompt, max_tokens, temperature, stream=False)
     return resp.choices[0].message["content"]  # type: ignore
 
-example_requests = "A story about a girl named Alice and her best friend Bob, who happens to be a cat."
\ No newline at end of file
+def _fetch(key: str, system_prompt: str, user_prompt: str, max_tokens: int, temperature: float) -> str:
+    """
+    Serve a request from the node-wide cache, or call the API within the node-wide quota.
+    Actual API calls go through the process-wide priority scheduler. The quota is taken
+    before the scheduler slot, so a call waiting for quota never holds a slot.
+    """
+    shared = get_shared_state()
+    if shared is None:
+        with get_scheduler().slot():
+            return _call_openai(system_prompt, user_prompt, max_tokens, temperature)
+
+    cacheable = shared.is_cacheable(temperature)
+    if cacheable:
+        cached = shared.cache_get(key)
+        if cached is not None:
+            return cached
+
+    reserved = estimate_tokens(system_prompt) + estimate_tokens(user_prompt) + max_tokens
+    shared.acquire(reserved, current_priority())
+    used = 0  # a call that fails (or is rejected by the scheduler) gives its whole reservation back
+    try:
+        with get_scheduler().slot():
+            response = _call_openai(system_prompt, user_prompt, max_tokens, temperature)
+        used = reserved - max_tokens + estimate_tokens(response)
+    finally:
+        shared.settle(reserved, used)
+
+    if cacheable:
+        shared.cache_put(key, response)
+    return response
+
+def call_model(system_prompt: str, user_prompt: str, max_tokens=3000, temperature=0.1) -> str:
+    key = request_key(system_prompt, user_prompt, max_tokens, temperature)
+    cassette = get_cassette()
+    if cassette is None:
+        return _fetch(key, system_prompt, user_prompt, max_tokens, temperature)
+
+    if cassette.mode == REPLAY:
+        return cassette.replay(key)
+
+    started = time.time()
+    t0 = time.perf_counter()
+    response = _fetch(key, system_prompt, user_prompt, max_tokens, temperature)
+    cassette.record(key, system_prompt, user_prompt, max_tokens, temperature, response, started, time.perf_counter() - t0)
+    return response
+
+def _split_paragraphs(text: str) -> Iterator[str]:
+    """Yield text in paragraph-sized pieces, keeping the separators."""
+    start = 0
+    while True:
+        end = text.find("\n\n", start)
+        if end == -1:
+            if start < len(text):
+                yield text[start:]
+            return
+        yield text[start:end + 2]
+        start = end + 2
+
+def _stream_openai(system_prompt: str, user_prompt: str, max_tokens: int, temperature: float) -> Iterator[str]:
+    resp = _create_completion(system_prompt, user_prompt, max_tokens, temperature, stream=True)
+    try:
+        for chunk in resp:
+            piece = chunk.choices[0].delta.get("content")  # type: ignore
+            if piece:
+                yield piece
+    finally:
+        # Stop reading the HTTP response as soon as the consumer abandons the stream
+        close = getattr(resp, "close", None)
+        if close is not None:
+            close()
+
+def stream_model(system_prompt: str, user_prompt: str, max_tokens=3000, temperature=0.1) -> Iterator[str]:
+    """
+    Streaming variant of call_model: yields the response text as it arrives.
+    Closing the generator early cancels the request, so callers can abort a bad draft midway.
+    """
+    key = request_key(system_prompt, user_prompt, max_tokens, temperature)
+    cassette = get_cassette()
+    if cassette is not None and cassette.mode == REPLAY:
+        yield from _split_paragraphs(cassette.replay(key, include_partial=True))
+        return
+
+    shared = get_shared_state()
+    reserved = estimate_tokens(system_prompt) + estimate_tokens(user_prompt) + max_tokens
+    if shared is not None:
+        shared.acquire(reserved, current_priority())
+    pieces = []
+    finished = False
+    started = time.time()
+    t0 = time.perf_counter()
+    try:
+        with get_scheduler().slot():
+            for piece in _stream_openai(system_prompt, user_prompt, max_tokens, temperature):
+                pieces.append(piece)
+                yield piece
+        finished = True
+    finally:
+        # Aborted streams are recorded as partial, with the text received so far, so a replayed stream
+        # aborts at the same point while call_model replays never see the truncated text
+        response = "".join(pieces)
+        if shared is not None:
+            # Nothing received (the request failed) gives the whole reservation back
+            shared.settle(reserved, reserved - max_tokens + estimate_tokens(response) if pieces else 0)
+        if cassette is not None:
+            cassette.record(key, system_prompt, user_prompt, max_tokens, temperature, response,
+                            started, time.perf_counter() - t0, partial=not finished)
+
+example_requests = "A story about a girl named Alice and her best friend Bob, who happens to be a cat."
@@ -0,0 +1,179 @@
+import time
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from model import request_timeout
+
+
+class StageFailed(RuntimeError):
+    """Raised when a stage still fails after all of its retries."""
+    def __init__(self, stage_name: str, error: BaseException):
+        super().__init__(f"Pipeline stage '{stage_name}' failed: {error}")
+        self.stage_name = stage_name
+        self.error = error
+
+
+class Stage:
+    """
+    One step of a pipeline graph.
+
+    The stage function is called with its declared inputs as keyword arguments.
+    It returns one value per declared output (a tuple when there are several).
+    - retries: extra attempts after a failure (with a short exponential backoff)
+    - timeout: seconds allowed per model call made by the stage (None = no limit). It is not
+      enforced by the engine: the stage runs under model.request_timeout(), which hands it to
+      the HTTP request, so the clock starts once the call is sent (not while it waits for
+      quota or a scheduler slot) and a timed-out call really stops before the stage is retried
+    - cache: memoize results by input values for the lifetime of the pipeline
+    """
+    def __init__(
+        self,
+        name: str,
+        func: Callable[..., Any],
+        inputs: Sequence[str],
+        outputs: Sequence[str],
+        retries: int = 0,
+        timeout: Optional[float] = None,
+        cache: bool = False,
+    ):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.retries = retries
+        self.timeout = timeout
+        self.cache = cache
+
+
+class StageTiming:
+    """How long a stage took, measured from its start to its last attempt's end."""
+    def __init__(self, name: str, started: float, seconds: float, attempts: int, cached: bool):
+        self.name = name
+        self.started = started  # seconds since the pipeline run started
+        self.seconds = seconds
+        self.attempts = attempts
+        self.cached = cached
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "started": round(self.started, 3),
+            "seconds": round(self.seconds, 3),
+            "attempts": self.attempts,
+            "cached": self.cached,
+        }
+
+
+class PipelineResult:
+    """All values produced by a pipeline run, plus per-stage timings."""
+    def __init__(self, values: Dict[str, Any], timings: List[StageTiming], total_seconds: float):
+        self.values = values
+        self.timings = timings
+        self.total_seconds = total_seconds
+
+    def __getitem__(self, name: str) -> Any:
+        return self.values[name]
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self.values.get(name, default)
+
+
+class Pipeline:
+    """
+    A small DAG executor. Stages declare the values they consume and produce;
+    every stage whose inputs are available runs concurrently with the others.
+    """
+    def __init__(self, stages: List[Stage], max_workers: int = 8, cache_size: int = 256):
+        self.stages = stages
+        self.max_workers = max_workers
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+        producers: Dict[str, str] = {}
+        for stage in stages:
+            for output in stage.outputs:
+                if output in producers:
+                    raise ValueError(f"'{output}' is produced by both '{producers[output]}' and '{stage.name}'")
+                producers[output] = stage.name
+        self.produced = set(producers)
+
+    def _cache_key(self, stage: Stage, kwargs: Dict[str, Any]) -> tuple:
+        return (stage.name,) + tuple(repr(kwargs[name]) for name in stage.inputs)
+
+    def _run_stage(self, stage: Stage, kwargs: Dict[str, Any], run_start: float):
+        started = time.perf_counter()
+        if stage.cache:
+            key = self._cache_key(stage, kwargs)
+            with self._cache_lock:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    values = self._cache[key]
+                    return values, StageTiming(stage.name, started - run_start, time.perf_counter() - started, 0, True)
+
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                with request_timeout(stage.timeout):
+                    result = stage.func(**kwargs)
+                break
+            except Exception as e:
+                if attempts > stage.retries:
+                    raise StageFailed(stage.name, e) from e
+                time.sleep(0.5 * 2 ** (attempts - 1))
+
+        values = (result,) if len(stage.outputs) == 1 else tuple(result)
+        if len(values) != len(stage.outputs):
+            raise StageFailed(stage.name, ValueError(f"expected {len(stage.outputs)} outputs, got {len(values)}"))
+
+        if stage.cache:
+            with self._cache_lock:
+                self._cache[key] = values
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return values, StageTiming(stage.name, started - run_start, time.perf_counter() - started, attempts, False)
+
+    def run(self, **inputs: Any) -> PipelineResult:
+        """
+        Run the graph on the given initial values.
+        Returns every value produced, together with per-stage timings.
+        """
+        for stage in self.stages:
+            missing = [name for name in stage.inputs if name not in inputs and name not in self.produced]
+            if missing:
+                raise ValueError(f"Stage '{stage.name}' needs inputs nobody provides: {', '.join(missing)}")
+
+        run_start = time.perf_counter()
+        values: Dict[str, Any] = dict(inputs)
+        timings: List[StageTiming] = []
+        pending = list(self.stages)
+        running: Dict[Future, Stage] = {}
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            while pending or running:
+                for stage in [s for s in pending if all(name in values for name in s.inputs)]:
+                    pending.remove(stage)
+                    kwargs = {name: values[name] for name in stage.inputs}
+                    # Carry context variables (e.g. the caller's priority class) into the worker thread
+                    ctx = contextvars.copy_context()
+                    running[executor.submit(ctx.run, self._run_stage, stage, kwargs, run_start)] = stage
+
+                if not running:
+                    names = ", ".join(stage.name for stage in pending)
+                    raise RuntimeError(f"Pipeline is stuck; these stages can never run: {names}")
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    stage_values, timing = future.result()
+                    values.update(zip(stage.outputs, stage_values))
+                    timings.append(timing)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        return PipelineResult(values, timings, time.perf_counter() - run_start)
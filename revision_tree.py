@@ -0,0 +1,127 @@
+import re
+import hashlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+def normalize_feedback(feedback: str) -> str:
+    """
+    Normalize revision feedback so trivially different phrasings share one cache entry
+    ("Shorter!" and "  shorter " are the same request).
+    """
+    return re.sub(r"\s+", " ", feedback).strip().strip(".!?").strip().lower()
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class RevisionTree:
+    """
+    Version tree for one story's revisions.
+
+    Each node is one step the user actually took: a parent node plus the feedback applied to it,
+    so undo always follows the path the user took, even when a revision happens to reproduce
+    the text of an earlier version. Revisions are memoized under (parent text, normalized
+    feedback), so re-applying feedback already tried on the same text, from any node, or
+    undoing and redoing, never calls the model again.
+
+    Node texts are deduplicated separately, by the hash of their text, and stored as tuples of
+    paragraph hashes over a shared paragraph pool: revisions usually keep most paragraphs
+    unchanged, so branches share their text.
+    """
+
+    def __init__(self, root_story: str):
+        self._paragraphs: Dict[str, str] = {}
+        self._texts: Dict[str, Tuple[str, ...]] = {}
+        self._node_text: List[str] = []
+        self._parents: List[Optional[int]] = []
+        self._feedback: List[str] = []
+        self._children: Dict[Tuple[int, str], int] = {}
+        self._revisions: Dict[Tuple[str, str], str] = {}  # (text digest, feedback) -> revised text digest
+        self._redo: List[int] = []
+        self.root = self._add_node(root_story, None, "")
+        self.current = self.root
+
+    def _store_text(self, text: str) -> str:
+        digest = _digest(text)
+        if digest not in self._texts:
+            refs = []
+            for paragraph in text.split("\n\n"):
+                ref = _digest(paragraph)
+                self._paragraphs.setdefault(ref, paragraph)
+                refs.append(ref)
+            self._texts[digest] = tuple(refs)
+        return digest
+
+    def _add_node(self, text: str, parent: Optional[int], feedback: str) -> int:
+        self._node_text.append(self._store_text(text))
+        self._parents.append(parent)
+        self._feedback.append(feedback)
+        return len(self._node_text) - 1
+
+    def _join(self, digest: str) -> str:
+        return "\n\n".join(self._paragraphs[ref] for ref in self._texts[digest])
+
+    def text(self, node: Optional[int] = None) -> str:
+        """Return the text of a node (the current one by default)."""
+        return self._join(self._node_text[self.current if node is None else node])
+
+    def revise(self, feedback: str, reviser: Callable[[str, str], str]) -> Tuple[str, bool]:
+        """
+        Apply feedback to the current version and move to the result.
+        reviser(current_story, feedback) is only called when this (text, feedback) pair is new.
+        Returns (revised_story, served_from_tree).
+        """
+        normalized = normalize_feedback(feedback)
+        key = (self.current, normalized)
+        memo = (self._node_text[self.current], normalized)
+        cached = key in self._children or memo in self._revisions
+        if key in self._children:
+            child = self._children[key]
+        else:
+            revised = self._join(self._revisions[memo]) if cached else reviser(self.text(), feedback)
+            child = self._add_node(revised, self.current, feedback)
+            self._children[key] = child
+            self._revisions[memo] = self._node_text[child]
+        self.current = child
+        self._redo = []
+        return (self.text(), cached)
+
+    def can_undo(self) -> bool:
+        return self._parents[self.current] is not None
+
+    def can_redo(self) -> bool:
+        return bool(self._redo)
+
+    def undo(self) -> str:
+        """Move to the parent node and return its text."""
+        parent = self._parents[self.current]
+        if parent is not None:
+            self._redo.append(self.current)
+            self.current = parent
+        return self.text()
+
+    def redo(self) -> str:
+        """Move back to the node most recently undone and return its text."""
+        if self._redo:
+            self.current = self._redo.pop()
+        return self.text()
+
+    def history(self) -> List[str]:
+        """Feedback applied along the path from the original story to the current version."""
+        path = []
+        node = self.current
+        while self._parents[node] is not None:
+            path.append(self._feedback[node])
+            node = self._parents[node]
+        return list(reversed(path))
+
+    def stats(self) -> Dict[str, int]:
+        """Versions held, and characters stored vs. what storing every version in full would take."""
+        return {
+            "versions": len(self._node_text),
+            "distinct_texts": len(self._texts),
+            "paragraphs_stored": len(self._paragraphs),
+            "chars_stored": sum(len(p) for p in self._paragraphs.values()),
+            "chars_undeduplicated": sum(len(self.text(node)) for node in range(len(self._node_text))),
+        }
@@ -0,0 +1,207 @@
+from model import stream_model
+from story_generator import build_storyteller_prompt
+from story_improviser import call_safety_judge, JudgeFeedback
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Iterable, Iterator, List, Optional, Tuple
+import re
+import contextvars
+
+# Words and phrases that never belong in a bedtime story for ages 5-10.
+# Kept deliberately narrow: this is a cheap first pass, the LLM judge catches the subtler cases.
+SAFETY_LEXICON = [
+    "blood", "bloody", "gore", "kill", "killed", "killing", "murder", "murdered",
+    "stab", "stabbed", "gun", "guns", "shoot", "shot dead", "corpse", "dead body",
+    "torture", "tortured", "suicide", "behead", "strangle",
+    "kidnap", "kidnapped", "weapon", "bomb", "slaughter",
+    "demon", "hell", "damn", "drunk", "beer", "cigarette",
+]
+
+_LEXICON_PATTERN = re.compile(
+    r"\b(" + "|".join(re.escape(term) for term in sorted(SAFETY_LEXICON, key=len, reverse=True)) + r")\b",
+    re.IGNORECASE,
+)
+
+# Safety judge dimensions that trigger an abort when scored at or below the threshold
+SCREENED_DIMENSIONS = ("Content safety", "No inappropriate themes")
+
+
+class ScreeningReport:
+    """Outcome of a screened generation: how many attempts it took and why drafts were stopped."""
+    def __init__(self):
+        self.attempts = 0
+        self.aborted_reasons: List[str] = []
+        self.words_discarded = 0
+        self.chunks_judged = 0
+        self.judge_errors = 0  # chunk-judge calls that failed; screening carries on without them
+
+    def to_dict(self):
+        return {
+            "attempts": self.attempts,
+            "aborted_reasons": self.aborted_reasons,
+            "words_discarded": self.words_discarded,
+            "chunks_judged": self.chunks_judged,
+            "judge_errors": self.judge_errors,
+        }
+
+
+def lexicon_hits(text: str) -> List[str]:
+    """
+    Return the unsafe lexicon terms found in the text (lower-cased, de-duplicated).
+    """
+    return sorted({match.lower() for match in _LEXICON_PATTERN.findall(text)})
+
+
+def iter_paragraphs(pieces: Iterable[str]) -> Iterator[str]:
+    """
+    Re-assemble streamed text pieces into completed paragraphs (separated by blank lines).
+    The last paragraph is yielded when the stream ends.
+    """
+    buffer = ""
+    for piece in pieces:
+        buffer += piece
+        while "\n\n" in buffer:
+            paragraph, buffer = buffer.split("\n\n", 1)
+            if paragraph.strip():
+                yield paragraph.strip()
+    if buffer.strip():
+        yield buffer.strip()
+
+
+def judge_violation(feedback: JudgeFeedback, threshold: int = 2) -> Optional[str]:
+    """
+    Return a reason string if the safety judge scored a screened dimension at or below the threshold.
+    """
+    for dimension in SCREENED_DIMENSIONS:
+        score = feedback.scores.get(dimension)
+        if score is not None and score <= threshold:
+            return f"safety judge scored '{dimension}' {score}/5: {feedback.feedback}"
+    return None
+
+
+def corrective_guidance(reasons: List[str]) -> str:
+    """
+    Extra system-prompt guidance for a restarted draft, based on why earlier drafts were stopped.
+    """
+    lines = "\n".join(f"- {reason}" for reason in reasons)
+    return f"""
+
+Safety correction (an earlier draft was stopped for these reasons):
+{lines}
+Keep every part of the story gentle and free of violence, weapons, death, or frightening imagery."""
+
+
+def _screen_draft(
+    user_request: str,
+    system_prompt: str,
+    user_prompt: str,
+    executor: ThreadPoolExecutor,
+    report: ScreeningReport,
+    chunk_words: int,
+    threshold: int,
+) -> Tuple[str, Optional[str]]:
+    """
+    Stream one draft, screening each paragraph as it completes.
+    Returns (draft, abort_reason); abort_reason is None if the draft passed.
+    """
+    paragraphs: List[str] = []
+    pending: List[Future] = []
+    chunk: List[str] = []
+    stream = stream_model(system_prompt, user_prompt, max_tokens=1500, temperature=0.85)
+
+    def submit_chunk():
+        if chunk:
+            # Run the judge under the caller's context so it keeps the caller's priority class
+            ctx = contextvars.copy_context()
+            pending.append(executor.submit(ctx.run, call_safety_judge, user_request, "\n\n".join(chunk)))
+            report.chunks_judged += 1
+            chunk.clear()
+
+    def first_judge_violation(wait: bool) -> Optional[str]:
+        for future in list(pending):
+            if not wait and not future.done():
+                continue
+            pending.remove(future)
+            try:
+                feedback = future.result()
+            except Exception:
+                # Screening is best-effort: a failed chunk judge (API error, overloaded scheduler)
+                # leaves that chunk to the lexicon check and the full judge panel afterwards
+                report.judge_errors += 1
+                continue
+            reason = judge_violation(feedback, threshold)
+            if reason:
+                return reason
+        return None
+
+    reason = None
+    try:
+        for paragraph in iter_paragraphs(stream):
+            paragraphs.append(paragraph)
+            hits = lexicon_hits(paragraph)
+            if hits:
+                reason = f"unsuitable words in the draft: {', '.join(hits)}"
+                break
+            chunk.append(paragraph)
+            if sum(len(p.split()) for p in chunk) >= chunk_words:
+                submit_chunk()
+            reason = first_judge_violation(wait=False)
+            if reason:
+                break
+        else:
+            submit_chunk()
+            reason = first_judge_violation(wait=True)
+    finally:
+        stream.close()
+        for future in pending:
+            future.cancel()
+
+    return ("\n\n".join(paragraphs), reason)
+
+
+def generate_story_screened(
+    user_request: str,
+    length_choice: str,
+    arc_choice: str,
+    category: str,
+    max_attempts: int = 3,
+    chunk_words: int = 120,
+    threshold: int = 2,
+) -> Tuple[str, ScreeningReport]:
+    """
+    Generate the draft with pipelined safety screening.
+
+    While the draft streams in, every completed paragraph goes through the local lexicon check,
+    and each ~chunk_words of text is sent to the LLM safety judge in the background.
+    A violation cancels the stream at once and generation restarts with corrective guidance.
+    The last attempt's draft is returned even if it was flagged, so the regular judge panel
+    and rewrite can still fix it.
+    """
+    base_system_prompt, user_prompt = build_storyteller_prompt(user_request, length_choice, arc_choice, category)
+    report = ScreeningReport()
+    draft = ""
+
+    executor = ThreadPoolExecutor(max_workers=4)
+    try:
+        for attempt in range(max_attempts):
+            report.attempts += 1
+            system_prompt = base_system_prompt
+            if report.aborted_reasons:
+                system_prompt += corrective_guidance(report.aborted_reasons)
+
+            if attempt == max_attempts - 1:
+                # Final attempt: no early abort, let the judge panel and rewrite deal with it
+                draft = "".join(stream_model(system_prompt, user_prompt, max_tokens=1500, temperature=0.85))
+                break
+
+            draft, reason = _screen_draft(
+                user_request, system_prompt, user_prompt, executor, report, chunk_words, threshold
+            )
+            if reason is None:
+                break
+            report.aborted_reasons.append(reason)
+            report.words_discarded += len(draft.split())
+    finally:
+        # Judge calls still in flight for an aborted draft are not worth waiting for
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return (draft, report)
@@ -0,0 +1,188 @@
+import os
+import time
+import itertools
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+# Priority classes, from most to least latency-sensitive
+INTERACTIVE = "interactive"
+REVISION = "revision"
+BATCH = "batch"
+PRIORITY_CLASSES = (INTERACTIVE, REVISION, BATCH)
+
+DEFAULT_WEIGHTS = {INTERACTIVE: 8, REVISION: 4, BATCH: 1}
+DEFAULT_MAX_QUEUE = {INTERACTIVE: 64, REVISION: 64, BATCH: 10000}
+
+_current_priority: contextvars.ContextVar = contextvars.ContextVar("story_priority", default=INTERACTIVE)
+
+
+class SchedulerOverloaded(RuntimeError):
+    """Raised by admission control when a priority class's queue is full."""
+
+
+@contextmanager
+def priority(priority_class: str) -> Iterator[None]:
+    """
+    Run the enclosed model calls under the given priority class.
+    Calls made outside any priority block are treated as interactive.
+    """
+    if priority_class not in PRIORITY_CLASSES:
+        raise ValueError(f"Unknown priority class: {priority_class!r}")
+    token = _current_priority.set(priority_class)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def current_priority() -> str:
+    return _current_priority.get()
+
+
+class Scheduler:
+    """
+    Central admission point for model calls made by this process.
+
+    - At most `capacity` calls are in flight at once.
+    - Waiting calls are dispatched by weighted fair queueing: each call gets a virtual
+      finish tag of max(now, class's last tag) + 1/weight, and the smallest tag goes next,
+      so interactive work overtakes a deep batch backlog without starving it.
+    - Batch calls may never take the last `batch_reserve` slots, so an interactive call
+      only ever waits for one in-flight call to finish, which bounds its latency.
+    - Each class has a maximum queue depth; beyond it, new calls are rejected.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 8,
+        batch_reserve: int = 2,
+        weights: Optional[Dict[str, float]] = None,
+        max_queue: Optional[Dict[str, int]] = None,
+        interactive_slo: float = 5.0,
+    ):
+        if batch_reserve >= capacity:
+            raise ValueError("batch_reserve must leave at least one slot for batch work")
+        self.capacity = capacity
+        self.batch_reserve = batch_reserve
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.max_queue = dict(DEFAULT_MAX_QUEUE, **(max_queue or {}))
+        self.interactive_slo = interactive_slo
+
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._vtime = 0.0
+        self._last_finish = {cls: 0.0 for cls in PRIORITY_CLASSES}
+        self._queues: Dict[str, deque] = {cls: deque() for cls in PRIORITY_CLASSES}
+        self._in_flight = {cls: 0 for cls in PRIORITY_CLASSES}
+        self._admitted = {cls: 0 for cls in PRIORITY_CLASSES}
+        self._rejected = {cls: 0 for cls in PRIORITY_CLASSES}
+        self._slo_misses = 0
+        self._waits = {cls: deque(maxlen=500) for cls in PRIORITY_CLASSES}
+
+    def _total_in_flight(self) -> int:
+        return sum(self._in_flight.values())
+
+    def _next_ticket(self) -> Optional[tuple]:
+        in_flight = self._total_in_flight()
+        if in_flight >= self.capacity:
+            return None
+        heads = [
+            queue[0] for cls, queue in self._queues.items()
+            if queue and (cls != BATCH or in_flight < self.capacity - self.batch_reserve)
+        ]
+        return min(heads) if heads else None
+
+    def _acquire(self, priority_class: str) -> tuple:
+        with self._cond:
+            queue = self._queues[priority_class]
+            if len(queue) >= self.max_queue[priority_class]:
+                self._rejected[priority_class] += 1
+                raise SchedulerOverloaded(
+                    f"{priority_class} queue is full ({len(queue)} waiting); try again later"
+                )
+
+            finish = max(self._vtime, self._last_finish[priority_class]) + 1.0 / self.weights[priority_class]
+            self._last_finish[priority_class] = finish
+            ticket = (finish, next(self._seq), priority_class)
+            queue.append(ticket)
+            enqueued = time.monotonic()
+
+            while self._next_ticket() is not ticket:
+                self._cond.wait()
+
+            queue.popleft()
+            self._vtime = finish
+            self._in_flight[priority_class] += 1
+            self._admitted[priority_class] += 1
+            waited = time.monotonic() - enqueued
+            self._waits[priority_class].append(waited)
+            if priority_class == INTERACTIVE and waited > self.interactive_slo:
+                self._slo_misses += 1
+            # Another waiter may also be eligible now
+            self._cond.notify_all()
+            return ticket
+
+    def _release(self, priority_class: str):
+        with self._cond:
+            self._in_flight[priority_class] -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority_class: Optional[str] = None) -> Iterator[None]:
+        """Hold one in-flight slot for the enclosed model call."""
+        priority_class = priority_class or current_priority()
+        self._acquire(priority_class)
+        try:
+            yield
+        finally:
+            self._release(priority_class)
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        """
+        Per-class queue depth, in-flight count, admitted/rejected totals and recent wait times.
+        """
+        with self._cond:
+            result = {}
+            for cls in PRIORITY_CLASSES:
+                waits = sorted(self._waits[cls])
+                result[cls] = {
+                    "queue_depth": len(self._queues[cls]),
+                    "in_flight": self._in_flight[cls],
+                    "admitted": self._admitted[cls],
+                    "rejected": self._rejected[cls],
+                    "wait_p50_s": round(waits[len(waits) // 2], 3) if waits else 0.0,
+                    "wait_p95_s": round(waits[int(len(waits) * 0.95)], 3) if waits else 0.0,
+                }
+            result[INTERACTIVE]["slo_misses"] = self._slo_misses
+            return result
+
+
+_scheduler: Optional[Scheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def use_scheduler(scheduler: Scheduler) -> Scheduler:
+    """Replace the process-wide scheduler."""
+    global _scheduler
+    _scheduler = scheduler
+    return scheduler
+
+
+def get_scheduler() -> Scheduler:
+    """
+    Return the process-wide scheduler, configuring it from the environment on first use:
+    STORY_MAX_CONCURRENCY, STORY_BATCH_RESERVE and STORY_INTERACTIVE_SLO (seconds).
+    """
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = Scheduler(
+                    capacity=int(os.getenv("STORY_MAX_CONCURRENCY", "8")),
+                    batch_reserve=int(os.getenv("STORY_BATCH_RESERVE", "2")),
+                    interactive_slo=float(os.getenv("STORY_INTERACTIVE_SLO", "5")),
+                )
+    return _scheduler
@@ -0,0 +1,194 @@
+import os
+import time
+import atexit
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from scheduler import BATCH
+from sqlite_store import SQLiteStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS response_cache (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS token_bucket (
+    name TEXT PRIMARY KEY,
+    level REAL NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for quota accounting (about 4 characters per token)."""
+    return len(text) // 4 + 1
+
+
+class SharedState(SQLiteStore):
+    """
+    Node-local coordination for call_model, shared by every worker process on the machine.
+
+    Backed by one SQLite database in WAL mode:
+    - a response cache: reads never block (WAL readers see the last committed snapshot)
+      and writes are buffered and flushed in batches;
+    - a global token bucket for requests per minute and tokens per minute, updated
+      atomically with BEGIN IMMEDIATE so concurrent workers never overspend the quota.
+      Batch callers may not draw the buckets below `batch_quota_reserve` (a fraction of each
+      limit), so interactive and revision calls from any process still find quota while a
+      batch run is draining it.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        requests_per_minute: float = 3500,
+        tokens_per_minute: float = 90000,
+        cache_max_temperature: float = 0.3,
+        batch_quota_reserve: float = 0.2,
+        flush_every: int = 16,
+        flush_interval: float = 1.0,
+    ):
+        self.limits = {"requests": requests_per_minute, "tokens": tokens_per_minute}
+        self.cache_max_temperature = cache_max_temperature
+        self.batch_quota_reserve = batch_quota_reserve
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, str] = {}
+        self._pending_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._flush_timer: Optional[threading.Timer] = None
+        super().__init__(path, SCHEMA)
+        atexit.register(self.flush)
+
+    # ---------- Response cache ----------
+
+    def is_cacheable(self, temperature: float) -> bool:
+        """Only near-deterministic calls (classifier, judges) are cached by default."""
+        return temperature <= self.cache_max_temperature
+
+    def cache_get(self, key: str) -> Optional[str]:
+        with self._pending_lock:
+            if key in self._pending:
+                return self._pending[key]
+        row = self._conn().execute("SELECT response FROM response_cache WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def cache_put(self, key: str, response: str):
+        with self._pending_lock:
+            self._pending[key] = response
+            due = (
+                len(self._pending) >= self.flush_every
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+            if not due and self._flush_timer is None:
+                # Make sure a lone entry reaches the other workers within flush_interval
+                self._flush_timer = threading.Timer(self.flush_interval, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered cache entries in a single transaction."""
+        with self._pending_lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not self._pending:
+                return
+            rows = [(key, response, time.time()) for key, response in self._pending.items()]
+            self._pending = {}
+            self._last_flush = time.monotonic()
+        with self.transaction() as conn:
+            conn.executemany("INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?)", rows)
+
+    # ---------- Global token bucket ----------
+
+    def _take(self, wants: List[Tuple[str, float]], floor: float = 0.0) -> float:
+        """
+        Try to take from each bucket atomically, leaving at least `floor` (a fraction of the limit) in it.
+        Returns 0.0 on success, otherwise the number of seconds to wait before retrying.
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            levels = {}
+            wait = 0.0
+            for name, amount in wants:
+                capacity = self.limits[name]
+                rate = capacity / 60.0
+                row = conn.execute("SELECT level, updated FROM token_bucket WHERE name = ?", (name,)).fetchone()
+                level = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+                levels[name] = level
+                amount = min(amount, capacity * (1 - floor))  # an oversized request waits for a full bucket, not forever
+                if level - amount < capacity * floor:
+                    wait = max(wait, (amount + capacity * floor - level) / rate)
+            if wait == 0.0:
+                for name, amount in wants:
+                    levels[name] -= min(amount, self.limits[name] * (1 - floor))
+            for name, level in levels.items():
+                conn.execute("INSERT OR REPLACE INTO token_bucket VALUES (?, ?, ?)", (name, level, now))
+        return wait
+
+    def acquire(self, tokens: int, priority_class: Optional[str] = None):
+        """
+        Block until one request and `tokens` tokens are available in the node-wide quota.
+        Batch callers only get quota above the interactive reserve.
+        """
+        wants = [(name, amount) for name, amount in (("requests", 1), ("tokens", tokens)) if self.limits[name] > 0]
+        if not wants:
+            return
+        floor = self.batch_quota_reserve if priority_class == BATCH else 0.0
+        while True:
+            wait = self._take(wants, floor)
+            if wait == 0.0:
+                return
+            time.sleep(min(wait, 1.0))
+
+    def settle(self, reserved: int, used: int):
+        """Return tokens reserved up front (max_tokens) but not actually used."""
+        unused = reserved - used
+        if unused <= 0 or self.limits["tokens"] <= 0:
+            return
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE token_bucket SET level = MIN(level + ?, ?) WHERE name = 'tokens'",
+                (unused, self.limits["tokens"]),
+            )
+
+
+_active: Optional[SharedState] = None
+_configured = False
+
+
+def use_shared_state(path: Optional[str], **kwargs) -> Optional[SharedState]:
+    """
+    Activate node-local coordination for all subsequent call_model traffic in this process.
+    Pass path=None to turn it off.
+    """
+    global _active, _configured
+    _active = SharedState(path, **kwargs) if path else None
+    _configured = True
+    return _active
+
+
+def get_shared_state() -> Optional[SharedState]:
+    """
+    Return the active shared state, configuring it from the environment on first use:
+    STORY_SHARED_STATE_PATH, STORY_RPM, STORY_TPM, STORY_CACHE_MAX_TEMPERATURE and
+    STORY_BATCH_QUOTA_RESERVE (share of the node-wide quota batch work may not use).
+    """
+    global _configured
+    if not _configured:
+        path = os.getenv("STORY_SHARED_STATE_PATH", "").strip()
+        if path:
+            use_shared_state(
+                path,
+                requests_per_minute=float(os.getenv("STORY_RPM", "3500")),
+                tokens_per_minute=float(os.getenv("STORY_TPM", "90000")),
+                cache_max_temperature=float(os.getenv("STORY_CACHE_MAX_TEMPERATURE", "0.3")),
+                batch_quota_reserve=float(os.getenv("STORY_BATCH_QUOTA_RESERVE", "0.2")),
+            )
+        _configured = True
+    return _active
@@ -0,0 +1,47 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class SQLiteStore:
+    """
+    Base for the SQLite-backed stores (shared state, story archive, story series).
+
+    The database runs in WAL mode, so readers never wait on writers. Each thread gets its own
+    connection in autocommit mode, and writes that must be atomic use transaction().
+    """
+
+    def __init__(self, path: str, schema: str, foreign_keys: bool = False):
+        self.path = path
+        self._foreign_keys = foreign_keys
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(schema)
+
+    def _conn(self) -> sqlite3.Connection:
+        """This thread's connection, opened on first use (waits up to 30s for locks)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if self._foreign_keys:
+                conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Run the enclosed statements in one write transaction (BEGIN IMMEDIATE, so concurrent
+        writers queue up instead of failing midway); rolled back if the block raises.
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
@@ -0,0 +1,311 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from story_improviser import JudgeFeedback
+from sqlite_store import SQLiteStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stories (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    request TEXT NOT NULL,
+    length TEXT NOT NULL,
+    arc TEXT NOT NULL,
+    category TEXT NOT NULL,
+    story TEXT NOT NULL,
+    timings TEXT NOT NULL,
+    story_hash TEXT NOT NULL DEFAULT '',
+    judged_hash TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS stories_arc ON stories (arc);
+CREATE INDEX IF NOT EXISTS stories_category ON stories (category);
+
+CREATE TABLE IF NOT EXISTS judges (
+    story_id INTEGER NOT NULL REFERENCES stories (id) ON DELETE CASCADE,
+    judge TEXT NOT NULL,
+    feedback TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS judges_story ON judges (story_id);
+
+CREATE TABLE IF NOT EXISTS scores (
+    story_id INTEGER NOT NULL REFERENCES stories (id) ON DELETE CASCADE,
+    judge TEXT NOT NULL,
+    dimension TEXT NOT NULL,
+    score INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scores_dimension ON scores (dimension, score, story_id);
+CREATE INDEX IF NOT EXISTS scores_story ON scores (story_id);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS stories_fts USING fts5 (
+    request, story, content='stories', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS stories_ai AFTER INSERT ON stories BEGIN
+    INSERT INTO stories_fts (rowid, request, story) VALUES (new.id, new.request, new.story);
+END;
+CREATE TRIGGER IF NOT EXISTS stories_ad AFTER DELETE ON stories BEGIN
+    INSERT INTO stories_fts (stories_fts, rowid, request, story) VALUES ('delete', old.id, old.request, old.story);
+END;
+CREATE TRIGGER IF NOT EXISTS stories_au AFTER UPDATE ON stories BEGIN
+    INSERT INTO stories_fts (stories_fts, rowid, request, story) VALUES ('delete', old.id, old.request, old.story);
+    INSERT INTO stories_fts (rowid, request, story) VALUES (new.id, new.request, new.story);
+END;
+"""
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ArchivedStory:
+    """
+    One archived story with its judge scorecard and per-stage timings (seconds).
+    judged is False while the stored text is a revision the scorecard does not describe.
+    """
+    __slots__ = ("id", "created", "request", "length", "arc", "category", "story", "judge_feedbacks", "timings",
+                 "judged")
+
+    def __init__(self, id: int, created: float, request: str, length: str, arc: str, category: str,
+                 story: str, judge_feedbacks: List[JudgeFeedback], timings: Dict[str, float], judged: bool = True):
+        self.id = id
+        self.created = created
+        self.request = request
+        self.length = length
+        self.arc = arc
+        self.category = category
+        self.story = story
+        self.judge_feedbacks = judge_feedbacks
+        self.timings = timings
+        self.judged = judged
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "created": self.created,
+            "request": self.request,
+            "length": self.length,
+            "arc": self.arc,
+            "category": self.category,
+            "story": self.story,
+            "judge_feedbacks": [feedback.to_dict() for feedback in self.judge_feedbacks],
+            "timings": self.timings,
+            "judged": self.judged,
+        }
+
+
+class StoryArchive(SQLiteStore):
+    """
+    Persistent, indexed archive of generated stories in SQLite.
+
+    Scores are stored one row per (story, dimension) with an index on (dimension, score),
+    and request/story text is indexed with FTS5, so queries like
+    "calming_bedtime stories scoring >= 4 on Sleep-inducing quality" never scan story bodies.
+
+    Each story keeps the hash of the text its scorecard was given for (judged_hash) next to the
+    hash of its current text (story_hash). Score queries only match stories whose current text
+    is the judged one, so a revision hides the scorecard and undoing back to the judged text
+    brings it back.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path, SCHEMA, foreign_keys=True)
+        self._add_hash_columns()
+
+    def _add_hash_columns(self):
+        """Upgrade archives created before story/judged hashes existed (their text counts as judged)."""
+        columns = {row[1] for row in self._conn().execute("PRAGMA table_info(stories)")}
+        if "judged_hash" in columns:
+            return
+        with self.transaction() as conn:
+            conn.execute("ALTER TABLE stories ADD COLUMN story_hash TEXT NOT NULL DEFAULT ''")
+            conn.execute("ALTER TABLE stories ADD COLUMN judged_hash TEXT NOT NULL DEFAULT ''")
+            rows = conn.execute("SELECT id, story FROM stories").fetchall()
+            conn.executemany(
+                "UPDATE stories SET story_hash = ?, judged_hash = ? WHERE id = ?",
+                [(_text_hash(story), _text_hash(story), story_id) for story_id, story in rows],
+            )
+
+    def _insert(self, conn: sqlite3.Connection, record: Dict) -> int:
+        cursor = conn.execute(
+            "INSERT INTO stories (created, request, length, arc, category, story, timings, story_hash, judged_hash) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                record.get("created", time.time()),
+                record["request"],
+                record["length"],
+                record["arc"],
+                record["category"],
+                record["story"],
+                json.dumps(record.get("timings") or {}, separators=(",", ":")),
+                _text_hash(record["story"]),
+                _text_hash(record["story"]),
+            ),
+        )
+        story_id = cursor.lastrowid
+        feedbacks = record.get("judge_feedbacks") or []
+        conn.executemany(
+            "INSERT INTO judges VALUES (?, ?, ?)",
+            [(story_id, feedback.judge_name, feedback.feedback) for feedback in feedbacks],
+        )
+        conn.executemany(
+            "INSERT INTO scores VALUES (?, ?, ?, ?)",
+            [
+                (story_id, feedback.judge_name, dimension, score)
+                for feedback in feedbacks
+                for dimension, score in feedback.scores.items()
+            ],
+        )
+        return story_id
+
+    def add_many(self, records: Iterable[Dict]) -> List[int]:
+        """
+        Insert several stories in one transaction.
+        Each record has: request, length, arc, category, story, judge_feedbacks (list of JudgeFeedback)
+        and optionally timings ({stage name: seconds}) and created (unix time).
+        Returns the new story ids.
+        """
+        with self.transaction() as conn:
+            ids = [self._insert(conn, record) for record in records]
+        return ids
+
+    def add_story(self, user_request: str, length_choice: str, arc_choice: str, category: str, story: str,
+                  judge_feedbacks: List[JudgeFeedback], timings: Optional[Dict[str, float]] = None) -> int:
+        """Insert one story and return its id."""
+        return self.add_many([{
+            "request": user_request,
+            "length": length_choice,
+            "arc": arc_choice,
+            "category": category,
+            "story": story,
+            "judge_feedbacks": judge_feedbacks,
+            "timings": timings,
+        }])[0]
+
+    def update_story(self, story_id: int, story: str):
+        """
+        Replace the story text (e.g. after a revision); the full-text index follows.
+        The scorecard is kept, but only counts in score queries while the text is the judged one.
+        """
+        self._conn().execute(
+            "UPDATE stories SET story = ?, story_hash = ? WHERE id = ?", (story, _text_hash(story), story_id)
+        )
+
+    def _load(self, rows: List[tuple]) -> List[ArchivedStory]:
+        if not rows:
+            return []
+        ids = [row[0] for row in rows]
+        placeholders = ",".join("?" * len(ids))
+        conn = self._conn()
+        feedbacks: Dict[int, Dict[str, JudgeFeedback]] = {story_id: {} for story_id in ids}
+        for story_id, judge, feedback in conn.execute(
+            f"SELECT story_id, judge, feedback FROM judges WHERE story_id IN ({placeholders}) ORDER BY rowid", ids
+        ):
+            feedbacks[story_id][judge] = JudgeFeedback(judge, {}, feedback)
+        for story_id, judge, dimension, score in conn.execute(
+            f"SELECT story_id, judge, dimension, score FROM scores WHERE story_id IN ({placeholders}) ORDER BY rowid", ids
+        ):
+            feedbacks[story_id][judge].scores[dimension] = score
+        return [
+            ArchivedStory(row[0], row[1], row[2], row[3], row[4], row[5], row[6],
+                          list(feedbacks[row[0]].values()), json.loads(row[7]), bool(row[8]))
+            for row in rows
+        ]
+
+    def get(self, story_id: int) -> Optional[ArchivedStory]:
+        rows = self._conn().execute(
+            "SELECT id, created, request, length, arc, category, story, timings, story_hash = judged_hash "
+            "FROM stories WHERE id = ?",
+            (story_id,)
+        ).fetchall()
+        stories = self._load(rows)
+        return stories[0] if stories else None
+
+    def search(
+        self,
+        text: Optional[str] = None,
+        arc: Optional[str] = None,
+        category: Optional[str] = None,
+        dimension: Optional[str] = None,
+        min_score: Optional[int] = None,
+        limit: int = 50,
+    ) -> List[ArchivedStory]:
+        """
+        Find stories, newest first.
+        - text: FTS5 query over the request and the story (e.g. 'dragon AND brave')
+        - arc / category: exact match
+        - dimension + min_score: e.g. dimension="Sleep-inducing quality", min_score=4
+        """
+        clauses = []
+        params: List = []
+        if text:
+            clauses.append("s.id IN (SELECT rowid FROM stories_fts WHERE stories_fts MATCH ?)")
+            params.append(text)
+        if arc:
+            clauses.append("s.arc = ?")
+            params.append(arc)
+        if category:
+            clauses.append("s.category = ?")
+            params.append(category)
+        if dimension:
+            # Only stories whose current text is the one that was judged
+            clauses.append("s.story_hash = s.judged_hash")
+            clauses.append("s.id IN (SELECT story_id FROM scores WHERE dimension = ? AND score >= ?)")
+            params.extend([dimension, min_score if min_score is not None else 1])
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._conn().execute(
+            f"SELECT s.id, s.created, s.request, s.length, s.arc, s.category, s.story, s.timings, "
+            f"s.story_hash = s.judged_hash "
+            f"FROM stories s {where} ORDER BY s.id DESC LIMIT ?",
+            params + [limit],
+        ).fetchall()
+        return self._load(rows)
+
+
+_archive: Optional[StoryArchive] = None
+_configured = False
+_archive_lock = threading.Lock()
+
+
+def get_archive() -> Optional[StoryArchive]:
+    """
+    Return the process-wide archive, opened on first use at STORY_ARCHIVE_PATH
+    (default story_archive.db; set it to an empty string to turn archiving off).
+    """
+    global _archive, _configured
+    if not _configured:
+        with _archive_lock:
+            if not _configured:
+                path = os.getenv("STORY_ARCHIVE_PATH", "story_archive.db").strip()
+                _archive = StoryArchive(path) if path else None
+                _configured = True
+    return _archive
+
+
+def timings_by_stage(result) -> Dict[str, float]:
+    """Per-stage seconds from a PipelineResult, in the compact form the archive stores."""
+    return {timing.name: round(timing.seconds, 3) for timing in result.timings}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Search the story archive.")
+    parser.add_argument("text", nargs="?", help="full-text query over requests and stories")
+    parser.add_argument("--arc")
+    parser.add_argument("--category")
+    parser.add_argument("--dimension", help='judge dimension, e.g. "Sleep-inducing quality"')
+    parser.add_argument("--min-score", type=int)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    archive = get_archive()
+    if archive is None:
+        raise SystemExit("Archiving is turned off (STORY_ARCHIVE_PATH is empty).")
+    for found in archive.search(args.text, args.arc, args.category, args.dimension, args.min_score, args.limit):
+        created = time.strftime("%Y-%m-%d %H:%M", time.localtime(found.created))
+        note = "" if found.judged else "  (revised since it was judged)"
+        print(f"#{found.id}  {created}  [{found.arc} / {found.category}]  {found.request[:70]}{note}")
@@ -0,0 +1,142 @@
+"""
+Long-running story daemon.
+
+Holds the warm pipeline in one process (imported modules, pooled HTTP client, caches,
+rate limiter, scheduler and archive) and serves jobs over a Unix domain socket, so the
+CLI can be a thin client instead of paying a cold start for every story.
+
+Start it with:
+    python story_daemon.py
+then run `python main.py` as usual; it uses the daemon automatically when it is running.
+"""
+import os
+import sys
+import json
+import signal
+import socketserver
+from typing import Dict
+
+from model import get_openai
+from scheduler import priority, get_scheduler, INTERACTIVE
+from shared_state import get_shared_state
+from story_archive import get_archive, timings_by_stage
+from story_improviser import judge_parse_stats
+from story_pipeline import run_story, run_series_episode, run_revision, format_timings
+from daemon_client import DaemonClient, socket_path
+
+
+def story_job(job: Dict) -> Dict:
+    """
+    Generate, archive and return one story.
+    Job fields: request, length, arc, and optionally screen, best_of, series and priority.
+    With a series name, the story is the next episode of that series (screen and best_of do not apply).
+    """
+    user_request = job["request"]
+    length_choice = job.get("length", "medium")
+    arc_choice = job.get("arc", "calming_bedtime")
+    series = job.get("series")
+    with priority(job.get("priority", INTERACTIVE)):
+        if series:
+            result = run_series_episode(series, user_request, length_choice, arc_choice)
+        else:
+            result = run_story(user_request, length_choice, arc_choice, job.get("screen", False), job.get("best_of", 0))
+
+    judge_feedbacks = result["judge_feedbacks"]
+    archive = get_archive()
+    archive_id = None
+    if archive is not None:
+        archive_id = archive.add_story(
+            user_request, length_choice, arc_choice, result["category"],
+            result["final_story"], judge_feedbacks, timings_by_stage(result)
+        )
+    screening = result.get("screening")
+    return {
+        "request": user_request,
+        "length": length_choice,
+        "arc": arc_choice,
+        "category": result["category"],
+        "final_story": result["final_story"],
+        "judge_feedbacks": [feedback.to_dict() for feedback in judge_feedbacks],
+        "screening_reasons": screening.aborted_reasons if screening is not None else [],
+        "timings_text": format_timings(result),
+        "archive_id": archive_id,
+        "series": series,
+        "episode": result["updated_bible"].episodes if series else None,
+    }
+
+
+def revise_job(job: Dict) -> Dict:
+    """Revise a story (and its archived copy, if archive_id is given)."""
+    revised_story = run_revision(job["request"], job["story"], job["feedback"])["revised_story"]
+    archive = get_archive()
+    if archive is not None and job.get("archive_id") is not None:
+        archive.update_story(job["archive_id"], revised_story)
+    return {"revised_story": revised_story}
+
+
+HANDLERS = {
+    "ping": lambda job: {"ok": True, "pid": os.getpid()},
+    "story": story_job,
+    "revise": revise_job,
+    "stats": lambda job: {"scheduler": get_scheduler().metrics(), "judge_parsing": judge_parse_stats.snapshot()},
+}
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    """One JSON job per connection: read a line, run it, write one JSON line back."""
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            job = json.loads(line)
+            handler = HANDLERS.get(job.get("op"))
+            if handler is None:
+                reply = {"error": f"Unknown op: {job.get('op')!r}"}
+            else:
+                reply = handler(job)
+        except Exception as e:
+            reply = {"error": f"{type(e).__name__}: {e}"}
+        self.wfile.write(json.dumps(reply, ensure_ascii=False).encode("utf-8") + b"\n")
+
+
+class StoryDaemon(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def warm_up():
+    """Load everything a job needs up front so the first job is as fast as the rest."""
+    get_openai()
+    get_shared_state()
+    get_scheduler()
+    get_archive()
+
+
+def serve(path: str):
+    if os.path.exists(path) and DaemonClient(path).ping():
+        sys.exit(f"A story daemon is already listening on {path}")
+    if os.path.exists(path):
+        # A leftover socket from a previous daemon that did not shut down cleanly
+        os.unlink(path)
+    warm_up()
+    # Shut down cleanly (and remove the socket) on `kill` as well as Ctrl-C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    # The socket is created private (0600) when it is bound, so other local users can never connect
+    old_umask = os.umask(0o077)
+    try:
+        server = StoryDaemon(path, JobHandler)
+    finally:
+        os.umask(old_umask)
+    with server:
+        print(f"Story daemon (pid {os.getpid()}) listening on {path}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(path)
+
+
+if __name__ == "__main__":
+    serve(sys.argv[1] if len(sys.argv) > 1 else socket_path())
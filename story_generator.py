@@ -214,10 +214,10 @@ Now write the complete bedtime story."""
 
     return (system_prompt, user_prompt)
     
-def generate_story(user_request: str, length_choice: str, arc_choice: str, category: str) -> str:
+def generate_story(user_request: str, length_choice: str, arc_choice: str, category: str, temperature: float = 0.85) -> str:
     """
     Use the storyteller prompt to generate an initial draft of the story.
     """
     system_prompt, user_prompt = build_storyteller_prompt(user_request, length_choice, arc_choice, category)
-    story = call_model(system_prompt, user_prompt, max_tokens=1500, temperature=0.85)
+    story = call_model(system_prompt, user_prompt, max_tokens=1500, temperature=temperature)
     return story
\ No newline at end of file
@@ -1,9 +1,12 @@
 from model import call_model
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 import re
+import threading
 
-# Data structure to hold judge feedback
+# Data structure to hold judge feedback (slotted: one is kept per judge for every archived story)
 class JudgeFeedback:
+    __slots__ = ("judge_name", "scores", "feedback")
+
     def __init__(self, judge_name: str, scores: Dict[str, int], feedback: str):
         self.judge_name = judge_name
         self.scores = scores  # Dict mapping dimension names to scores (1-5)
@@ -16,6 +19,13 @@ class JudgeFeedback:
             "feedback": self.feedback
         }
 
+    @classmethod
+    def from_dict(cls, data: Dict) -> "JudgeFeedback":
+        return cls(data["judge_name"], dict(data["scores"]), data["feedback"])
+
+    def __repr__(self):
+        return f"JudgeFeedback({self.judge_name!r}, {self.scores!r}, {self.feedback!r})"
+
 def build_safety_judge_prompt(user_request: str, draft_story: str) -> tuple[str, str]:
     """
     Build the prompt for the Safety & Age Appropriateness Judge.
@@ -158,67 +168,175 @@ Evaluate how well this story aligns with the parent's chosen intent."""
 
     return (system_prompt, user_prompt)
 
-def parse_judge_response(response: str, judge_name: str) -> JudgeFeedback:
+# Judge names and the exact score dimensions each judge's prompt asks for
+SAFETY_JUDGE = "Safety & Age Appropriateness Judge"
+NARRATIVE_JUDGE = "Narrative Structure Judge"
+EMOTIONAL_TONE_JUDGE = "Emotional Tone & Bedtime Judge"
+PARENT_INTENT_JUDGE = "Parent-Intent Alignment Judge"
+
+JUDGE_DIMENSIONS = {
+    SAFETY_JUDGE: ("Age-appropriate language", "Content safety", "No inappropriate themes"),
+    NARRATIVE_JUDGE: ("Clear beginning", "Well-developed middle", "Satisfying ending", "Overall coherence"),
+    EMOTIONAL_TONE_JUDGE: (
+        "Bedtime-appropriate tone", "Emotional warmth", "Sleep-inducing quality", "Positive emotional resolution"
+    ),
+    PARENT_INTENT_JUDGE: ("Alignment with parent intent", "Clear lesson/message", "Effective delivery of intent"),
+}
+
+DEFAULT_FEEDBACK = "No specific feedback provided."
+
+# Compiled once: a section header ("SCORES:", "**Feedback:**") and a score line
+# ("- Content safety: 5", "2. **Content safety** - 5/5"); fractional scores like "4.5" do not match
+_SECTION_LINE = re.compile(r'^\W*(SCORES|FEEDBACK)\b\W*?:\**\s*(.*)$', re.IGNORECASE)
+_SCORE_LINE = re.compile(r'^\s*(?:[-*•]|\d+[.)])?\s*\**\s*(.+?)\s*\**\s*[:=\-–]\s*\**\s*\[?([1-5])\]?(?:\s*/\s*5)?(?!\.?\d)')
+_NON_WORD = re.compile(r'[^a-z0-9]+')
+
+
+def _dimension_key(name: str) -> str:
+    return _NON_WORD.sub("", name.lower())
+
+
+def parse_judge_response(response: str, judge_name: str, expected_dimensions: Optional[Tuple[str, ...]] = None) -> JudgeFeedback:
     """
-    Parse the judge's response to extract scores and feedback.
+    Parse the judge's response to extract scores and feedback in a single pass over its lines.
+
+    Scores are only kept for the judge's expected dimensions (from JUDGE_DIMENSIONS unless given),
+    matched case- and punctuation-insensitively and stored under their canonical names.
+    Judges not in JUDGE_DIMENSIONS keep every dimension they report.
     """
-    scores = {}
-    feedback = ""
-    
-    # Extract scores - try multiple patterns
-    scores_section = re.search(r'SCORES:(.*?)(?:FEEDBACK:|$)', response, re.DOTALL | re.IGNORECASE)
-    if scores_section:
-        score_text = scores_section.group(1)
-        # Find all score lines - try multiple patterns
-        score_lines = re.findall(r'- (.+?):\s*(\d+)', score_text)
-        if not score_lines:
-            # Try without dash
-            score_lines = re.findall(r'(.+?):\s*(\d+)', score_text)
-        for dimension, score in score_lines:
-            score_val = int(score)
-            # Ensure score is in valid range
-            if 1 <= score_val <= 5:
-                scores[dimension.strip()] = score_val
-    
-    # Extract feedback - try multiple patterns
-    feedback_section = re.search(r'FEEDBACK:\s*(.+?)(?:\n\n|\Z)', response, re.DOTALL | re.IGNORECASE)
-    if feedback_section:
-        feedback = feedback_section.group(1).strip()
-    else:
-        # Fallback: try to get everything after FEEDBACK:
-        feedback_match = re.search(r'FEEDBACK:\s*(.+)', response, re.DOTALL | re.IGNORECASE)
-        if feedback_match:
-            feedback = feedback_match.group(1).strip()
-    
-    # If no feedback found, use a default message
-    if not feedback:
-        feedback = "No specific feedback provided."
-    
+    if expected_dimensions is None:
+        expected_dimensions = JUDGE_DIMENSIONS.get(judge_name)
+    canonical = {_dimension_key(name): name for name in expected_dimensions} if expected_dimensions else None
+
+    scores: Dict[str, int] = {}
+    feedback_lines: List[str] = []
+    section = None
+    for line in response.splitlines():
+        header = _SECTION_LINE.match(line)
+        if header:
+            section = header.group(1).upper()
+            line = header.group(2)
+            if not line.strip():
+                continue
+        if section == "FEEDBACK":
+            if line.strip():
+                feedback_lines.append(line.strip())
+            elif feedback_lines:
+                section = None  # a blank line ends the feedback paragraph
+            continue
+        match = _SCORE_LINE.match(line)
+        if match:
+            name = match.group(1).strip(" *")
+            if canonical is None:
+                scores[name] = int(match.group(2))
+            elif _dimension_key(name) in canonical:
+                scores[canonical[_dimension_key(name)]] = int(match.group(2))
+
+    feedback = " ".join(feedback_lines) or DEFAULT_FEEDBACK
     return JudgeFeedback(judge_name, scores, feedback)
 
+
+def missing_fields(feedback: JudgeFeedback) -> List[str]:
+    """Expected dimensions the judge did not score, plus "FEEDBACK" if it gave no feedback."""
+    missing = [name for name in JUDGE_DIMENSIONS.get(feedback.judge_name, ()) if name not in feedback.scores]
+    if feedback.feedback == DEFAULT_FEEDBACK:
+        missing.append("FEEDBACK")
+    return missing
+
+
+def build_repair_prompt(judge_name: str, previous_response: str, missing: List[str]) -> tuple[str, str]:
+    """
+    Build a small prompt asking the judge only for the fields its reply left out.
+    The judge's own earlier reply is sent instead of the full story.
+    """
+    score_lines = "\n".join(f"- {name}: [1-5]" for name in missing if name != "FEEDBACK")
+    parts = []
+    if score_lines:
+        parts.append(f"SCORES:\n{score_lines}")
+    if "FEEDBACK" in missing:
+        parts.append("FEEDBACK:\n[1-2 sentences of feedback]")
+    expected_format = "\n\n".join(parts)
+
+    system_prompt = f"""You are the {judge_name} for children's bedtime stories.
+
+Your previous evaluation did not follow the required format and left out some fields.
+Based on your previous evaluation, provide ONLY the missing fields in this EXACT format:
+{expected_format}"""
+
+    user_prompt = f"""Your previous evaluation:
+{previous_response}
+
+Provide only the missing fields."""
+
+    return (system_prompt, user_prompt)
+
+
+class JudgeParseStats:
+    """Per-judge counts of replies that needed repair (thread-safe)."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def record(self, judge_name: str, needed_repair: bool, still_missing: bool):
+        with self._lock:
+            counts = self._counts.setdefault(judge_name, {"calls": 0, "parse_failures": 0, "unrecovered": 0})
+            counts["calls"] += 1
+            counts["parse_failures"] += needed_repair
+            counts["unrecovered"] += still_missing
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Counts per judge, plus the share of replies that failed strict parsing."""
+        with self._lock:
+            return {
+                judge: dict(counts, failure_rate=round(counts["parse_failures"] / counts["calls"], 3))
+                for judge, counts in self._counts.items()
+            }
+
+
+judge_parse_stats = JudgeParseStats()
+
+
+def run_judge(judge_name: str, system_prompt: str, user_prompt: str) -> JudgeFeedback:
+    """
+    Call a judge and strictly parse its reply. If fields are missing, send one small repair
+    prompt for just those fields and merge the answer in.
+    """
+    response = call_model(system_prompt, user_prompt, max_tokens=300, temperature=0.3)
+    result = parse_judge_response(response, judge_name)
+    missing = missing_fields(result)
+    if missing:
+        repair_system, repair_user = build_repair_prompt(judge_name, response, missing)
+        repair = call_model(repair_system, repair_user, max_tokens=40 + 15 * len(missing), temperature=0.0)
+        repaired = parse_judge_response(repair, judge_name)
+        for name, score in repaired.scores.items():
+            result.scores.setdefault(name, score)
+        if result.feedback == DEFAULT_FEEDBACK:
+            result.feedback = repaired.feedback
+        # Keep dimensions in the order the judge's prompt lists them
+        order = JUDGE_DIMENSIONS[judge_name]
+        result.scores = {name: result.scores[name] for name in order if name in result.scores}
+    judge_parse_stats.record(judge_name, bool(missing), bool(missing_fields(result)))
+    return result
+
 def call_safety_judge(user_request: str, draft_story: str) -> JudgeFeedback:
     """Call the Safety & Age Appropriateness Judge."""
     system_prompt, user_prompt = build_safety_judge_prompt(user_request, draft_story)
-    response = call_model(system_prompt, user_prompt, max_tokens=300, temperature=0.3)
-    return parse_judge_response(response, "Safety & Age Appropriateness Judge")
+    return run_judge(SAFETY_JUDGE, system_prompt, user_prompt)
 
 def call_narrative_judge(user_request: str, draft_story: str) -> JudgeFeedback:
     """Call the Narrative Structure Judge."""
     system_prompt, user_prompt = build_narrative_judge_prompt(user_request, draft_story)
-    response = call_model(system_prompt, user_prompt, max_tokens=300, temperature=0.3)
-    return parse_judge_response(response, "Narrative Structure Judge")
+    return run_judge(NARRATIVE_JUDGE, system_prompt, user_prompt)
 
 def call_emotional_tone_judge(user_request: str, draft_story: str) -> JudgeFeedback:
     """Call the Emotional Tone & Bedtime Judge."""
     system_prompt, user_prompt = build_emotional_tone_judge_prompt(user_request, draft_story)
-    response = call_model(system_prompt, user_prompt, max_tokens=300, temperature=0.3)
-    return parse_judge_response(response, "Emotional Tone & Bedtime Judge")
+    return run_judge(EMOTIONAL_TONE_JUDGE, system_prompt, user_prompt)
 
 def call_parent_intent_judge(user_request: str, draft_story: str, arc_choice: str, arc_description: str = "") -> JudgeFeedback:
     """Call the Parent-Intent Alignment Judge."""
     system_prompt, user_prompt = build_parent_intent_judge_prompt(user_request, draft_story, arc_choice, arc_description)
-    response = call_model(system_prompt, user_prompt, max_tokens=300, temperature=0.3)
-    return parse_judge_response(response, "Parent-Intent Alignment Judge")
+    return run_judge(PARENT_INTENT_JUDGE, system_prompt, user_prompt)
 
 def judge_panel_evaluation(user_request: str, draft_story: str, arc_choice: str, arc_description: str = "") -> List[JudgeFeedback]:
     """
@@ -309,6 +427,14 @@ Revise the story to address the feedback."""
 
     return (system_prompt, user_prompt)
 
+def rewrite_with_feedback(user_request: str, draft_story: str, judge_feedbacks: List[JudgeFeedback]) -> str:
+    """
+    Rewrite the draft to address the aggregated judge panel feedback.
+    """
+    aggregated_feedback = aggregate_judge_feedback(judge_feedbacks)
+    system_prompt, user_prompt = build_rewrite_prompt_with_feedback(user_request, draft_story, aggregated_feedback)
+    return call_model(system_prompt, user_prompt, max_tokens=1500, temperature=0.4)
+
 def judge_and_improve_story(user_request: str, draft_story: str, arc_choice: str = "calming_bedtime", arc_description: str = "") -> Tuple[str, List[JudgeFeedback]]:
     """
     Use the judge panel to evaluate and improve the draft story.
@@ -317,12 +443,8 @@ def judge_and_improve_story(user_request: str, draft_story: str, arc_choice: str
     # Run the judge panel evaluation
     judge_feedbacks = judge_panel_evaluation(user_request, draft_story, arc_choice, arc_description)
     
-    # Aggregate feedback
-    aggregated_feedback = aggregate_judge_feedback(judge_feedbacks)
-    
     # Rewrite the story based on feedback
-    system_prompt, user_prompt = build_rewrite_prompt_with_feedback(user_request, draft_story, aggregated_feedback)
-    improved_story = call_model(system_prompt, user_prompt, max_tokens=1500, temperature=0.4)
+    improved_story = rewrite_with_feedback(user_request, draft_story, judge_feedbacks)
     
     return (improved_story, judge_feedbacks)
 
@@ -0,0 +1,227 @@
+from pipeline import Pipeline, PipelineResult, Stage
+from story_generator import categorize_request, generate_story, arc_instruction
+from story_improviser import (
+    call_safety_judge,
+    call_narrative_judge,
+    call_emotional_tone_judge,
+    call_parent_intent_judge,
+    rewrite_with_feedback,
+    revise_story,
+)
+from safety_screening import generate_story_screened
+from best_of_n import generate_best_of_n
+from story_series import generate_series_episode, get_series_store
+from scheduler import priority, REVISION
+
+# Shared retry/timeout policy for model-backed stages (the timeout bounds each model call, see Stage)
+JUDGE_POLICY = {"retries": 2, "timeout": 60}
+WRITER_POLICY = {"retries": 1, "timeout": 120}
+
+
+def draft_stage(user_request: str, length_choice: str, arc_choice: str, category: str, screen_while_writing: bool):
+    """Write the first draft, optionally with pipelined safety screening."""
+    if screen_while_writing:
+        return generate_story_screened(user_request, length_choice, arc_choice, category)
+    return (generate_story(user_request, length_choice, arc_choice, category), None)
+
+
+def best_of_n_stage(user_request: str, length_choice: str, arc_choice: str, category: str, draft_count: int):
+    """Write draft_count drafts concurrently and keep the best by local score."""
+    return generate_best_of_n(user_request, length_choice, arc_choice, category, draft_count)
+
+
+def series_draft_stage(user_request: str, length_choice: str, arc_choice: str, category: str, series_bible):
+    """Write the next episode of a series, with the series bible in the prompt."""
+    return generate_series_episode(user_request, length_choice, arc_choice, category, series_bible)
+
+
+def bible_stage(series_bible, final_story: str, arc_choice: str):
+    """Fold the finished episode into the series bible (memoized in the series store)."""
+    return get_series_store().update_bible(series_bible, final_story, arc_choice)
+
+
+def rewrite_stage(user_request: str, draft_story: str, safety_feedback, narrative_feedback,
+                  emotional_tone_feedback, parent_intent_feedback):
+    """Rewrite the draft using the whole panel's feedback."""
+    judge_feedbacks = [safety_feedback, narrative_feedback, emotional_tone_feedback, parent_intent_feedback]
+    return (rewrite_with_feedback(user_request, draft_story, judge_feedbacks), judge_feedbacks)
+
+
+def scorecard_stage(draft_story: str, safety_feedback, narrative_feedback,
+                    emotional_tone_feedback, parent_intent_feedback):
+    """Best-of-N keeps the winning draft as-is; the panel only scores it."""
+    judge_feedbacks = [safety_feedback, narrative_feedback, emotional_tone_feedback, parent_intent_feedback]
+    return (draft_story, judge_feedbacks)
+
+
+def judge_stages() -> list:
+    """The four judges; each only needs the draft, so they all run concurrently."""
+    return [
+        Stage("judge_safety", call_safety_judge, ["user_request", "draft_story"], ["safety_feedback"], **JUDGE_POLICY),
+        Stage("judge_narrative", call_narrative_judge, ["user_request", "draft_story"], ["narrative_feedback"], **JUDGE_POLICY),
+        Stage(
+            "judge_emotional_tone", call_emotional_tone_judge,
+            ["user_request", "draft_story"], ["emotional_tone_feedback"],
+            **JUDGE_POLICY,
+        ),
+        Stage(
+            "judge_parent_intent", call_parent_intent_judge,
+            ["user_request", "draft_story", "arc_choice", "arc_description"], ["parent_intent_feedback"],
+            **JUDGE_POLICY,
+        ),
+    ]
+
+
+JUDGE_OUTPUTS = ["safety_feedback", "narrative_feedback", "emotional_tone_feedback", "parent_intent_feedback"]
+
+
+def build_story_pipeline() -> Pipeline:
+    """
+    The full story graph:
+    categorize -> draft -> (4 judges, concurrently) -> rewrite.
+
+    Inputs: user_request, length_choice, arc_choice, screen_while_writing.
+    Produces: category, arc_description, draft_story, screening, the four *_feedback values,
+    final_story and judge_feedbacks.
+    """
+    return Pipeline([
+        Stage("categorize", categorize_request, ["user_request"], ["category"], cache=True, **JUDGE_POLICY),
+        Stage("arc_description", arc_instruction, ["arc_choice"], ["arc_description"]),
+        Stage(
+            "draft", draft_stage,
+            ["user_request", "length_choice", "arc_choice", "category", "screen_while_writing"],
+            ["draft_story", "screening"],
+            **WRITER_POLICY,
+        ),
+        *judge_stages(),
+        Stage(
+            "rewrite", rewrite_stage,
+            ["user_request", "draft_story"] + JUDGE_OUTPUTS,
+            ["final_story", "judge_feedbacks"],
+            **WRITER_POLICY,
+        ),
+    ])
+
+
+def build_best_of_n_pipeline() -> Pipeline:
+    """
+    The best-of-N graph:
+    categorize -> N drafts (concurrently) + local selection -> (4 judges, concurrently) -> scorecard.
+    No rewrite, so wall-clock time is about one generation plus one judge round.
+
+    Inputs: user_request, length_choice, arc_choice, draft_count.
+    Produces: category, arc_description, draft_story, draft_scores, the four *_feedback values,
+    final_story and judge_feedbacks.
+    """
+    return Pipeline([
+        Stage("categorize", categorize_request, ["user_request"], ["category"], cache=True, **JUDGE_POLICY),
+        Stage("arc_description", arc_instruction, ["arc_choice"], ["arc_description"]),
+        Stage(
+            "drafts", best_of_n_stage,
+            ["user_request", "length_choice", "arc_choice", "category", "draft_count"],
+            ["draft_story", "draft_scores"],
+            **WRITER_POLICY,
+        ),
+        *judge_stages(),
+        Stage("scorecard", scorecard_stage, ["draft_story"] + JUDGE_OUTPUTS, ["final_story", "judge_feedbacks"]),
+    ])
+
+
+def build_series_pipeline() -> Pipeline:
+    """
+    The series graph: the story graph with the series bible in the draft prompt,
+    followed by one summarization that folds the final story into the bible.
+
+    Inputs: user_request, length_choice, arc_choice, series_bible.
+    Produces: category, arc_description, draft_story, the four *_feedback values,
+    final_story, judge_feedbacks and updated_bible.
+    """
+    return Pipeline([
+        Stage("categorize", categorize_request, ["user_request"], ["category"], cache=True, **JUDGE_POLICY),
+        Stage("arc_description", arc_instruction, ["arc_choice"], ["arc_description"]),
+        Stage(
+            "draft", series_draft_stage,
+            ["user_request", "length_choice", "arc_choice", "category", "series_bible"],
+            ["draft_story"],
+            **WRITER_POLICY,
+        ),
+        *judge_stages(),
+        Stage(
+            "rewrite", rewrite_stage,
+            ["user_request", "draft_story"] + JUDGE_OUTPUTS,
+            ["final_story", "judge_feedbacks"],
+            **WRITER_POLICY,
+        ),
+        Stage("series_bible", bible_stage, ["series_bible", "final_story", "arc_choice"], ["updated_bible"], **JUDGE_POLICY),
+    ])
+
+
+def build_revision_pipeline() -> Pipeline:
+    """
+    The revision graph: inputs user_request, current_story, feedback; produces revised_story.
+    """
+    return Pipeline([
+        Stage("revise", revise_story, ["user_request", "current_story", "feedback"], ["revised_story"], **WRITER_POLICY),
+    ])
+
+
+STORY_PIPELINE = build_story_pipeline()
+BEST_OF_N_PIPELINE = build_best_of_n_pipeline()
+SERIES_PIPELINE = build_series_pipeline()
+REVISION_PIPELINE = build_revision_pipeline()
+
+
+def run_story(user_request: str, length_choice: str, arc_choice: str, screen_while_writing: bool = False,
+              best_of_n: int = 0) -> PipelineResult:
+    """
+    Run the story graph. Used by the CLI, the Streamlit app and the batch runner.
+    With best_of_n >= 2, runs the best-of-N graph instead (safety screening does not apply there).
+    """
+    if best_of_n >= 2:
+        return BEST_OF_N_PIPELINE.run(
+            user_request=user_request,
+            length_choice=length_choice,
+            arc_choice=arc_choice,
+            draft_count=best_of_n,
+        )
+    return STORY_PIPELINE.run(
+        user_request=user_request,
+        length_choice=length_choice,
+        arc_choice=arc_choice,
+        screen_while_writing=screen_while_writing,
+    )
+
+
+def run_series_episode(series: str, user_request: str, length_choice: str, arc_choice: str) -> PipelineResult:
+    """
+    Run the series graph for the next episode of `series` and save the updated bible.
+    Only the bounded bible is sent to the model, never the text of earlier episodes.
+    Raises SeriesConflict if another process wrote the same episode concurrently.
+    """
+    store = get_series_store()
+    # Episodes of one series run one at a time, so each starts from the previous episode's bible
+    with store.lock(series):
+        result = SERIES_PIPELINE.run(
+            user_request=user_request,
+            length_choice=length_choice,
+            arc_choice=arc_choice,
+            series_bible=store.load(series),
+        )
+        store.save(result["updated_bible"])
+    return result
+
+
+def run_revision(user_request: str, current_story: str, feedback: str) -> PipelineResult:
+    """Run the revision graph at revision priority."""
+    with priority(REVISION):
+        return REVISION_PIPELINE.run(user_request=user_request, current_story=current_story, feedback=feedback)
+
+
+def format_timings(result: PipelineResult) -> str:
+    """One line per stage, in start order, plus the total wall-clock time."""
+    lines = []
+    for timing in sorted(result.timings, key=lambda t: t.started):
+        note = " (cached)" if timing.cached else (f" ({timing.attempts} attempts)" if timing.attempts > 1 else "")
+        lines.append(f"  {timing.name:<22} start {timing.started:6.2f}s  took {timing.seconds:6.2f}s{note}")
+    lines.append(f"  {'total':<22} {result.total_seconds:.2f}s")
+    return "\n".join(lines)
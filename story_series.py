@@ -0,0 +1,295 @@
+"""
+Multi-night story series.
+
+Each series keeps a compact "story bible" (characters, settings, lessons covered, a short synopsis
+and one-line summaries of the latest episodes) instead of the full text of earlier stories.
+The bible has fixed bounds and is compacted by one low-temperature summarization call per new
+episode, so the prompt for episode 30 is about the same size as the prompt for episode 2.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+from model import call_model
+from story_generator import build_storyteller_prompt
+from sqlite_store import SQLiteStore
+
+# Bounds that keep the bible (and so every episode prompt) a constant size
+MAX_CHARACTERS = 8
+MAX_SETTINGS = 6
+MAX_LESSONS = 10
+RECENT_EPISODES = 3
+MAX_ITEM_CHARS = 120
+MAX_SYNOPSIS_WORDS = 80
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    name TEXT PRIMARY KEY,
+    updated REAL NOT NULL,
+    bible TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bible_updates (
+    key TEXT PRIMARY KEY,
+    bible TEXT NOT NULL
+);
+"""
+
+
+class SeriesConflict(RuntimeError):
+    """Raised when another process saved a new episode of the series first."""
+
+
+def _clip(items: List[str], limit: int, keep_last: bool = False) -> List[str]:
+    """
+    Trim, de-duplicate and bound a list of short entries. Entries like "Pip - a shy dragon" are
+    de-duplicated by the part before " - " (first wins); keep_last keeps the newest entries.
+    """
+    seen = set()
+    clipped = []
+    for item in items:
+        item = " ".join(str(item).split())[:MAX_ITEM_CHARS]
+        key = item.split(" - ")[0].lower()
+        if item and key not in seen:
+            seen.add(key)
+            clipped.append(item)
+    return clipped[-limit:] if keep_last else clipped[:limit]
+
+
+def _clip_words(text: str, limit: int) -> str:
+    words = str(text).split()
+    return " ".join(words[:limit]) + (" ..." if len(words) > limit else "")
+
+
+class StoryBible:
+    """The compact, bounded memory of one series."""
+    __slots__ = ("series", "episodes", "characters", "settings", "lessons", "synopsis", "recent")
+
+    def __init__(self, series: str, episodes: int = 0, characters: Optional[List[str]] = None,
+                 settings: Optional[List[str]] = None, lessons: Optional[List[str]] = None,
+                 synopsis: str = "", recent: Optional[List[str]] = None):
+        self.series = series
+        self.episodes = episodes
+        self.characters = _clip(characters or [], MAX_CHARACTERS)
+        self.settings = _clip(settings or [], MAX_SETTINGS)
+        self.lessons = _clip(lessons or [], MAX_LESSONS, keep_last=True)
+        self.synopsis = _clip_words(synopsis, MAX_SYNOPSIS_WORDS) if synopsis else ""
+        self.recent = _clip(recent or [], RECENT_EPISODES, keep_last=True)
+
+    def to_dict(self):
+        return {
+            "series": self.series,
+            "episodes": self.episodes,
+            "characters": self.characters,
+            "settings": self.settings,
+            "lessons": self.lessons,
+            "synopsis": self.synopsis,
+            "recent": self.recent,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "StoryBible":
+        return cls(data["series"], data.get("episodes", 0), data.get("characters"), data.get("settings"),
+                   data.get("lessons"), data.get("synopsis", ""), data.get("recent"))
+
+    def fingerprint(self) -> str:
+        return hashlib.sha256(json.dumps(self.to_dict(), sort_keys=True).encode("utf-8")).hexdigest()
+
+    def render(self) -> str:
+        """The bible as prompt text; empty before the first episode."""
+        if self.episodes == 0:
+            return ""
+        lines = [f"Series: {self.series} ({self.episodes} episode(s) so far)"]
+        if self.synopsis:
+            lines.append(f"The story so far: {self.synopsis}")
+        if self.characters:
+            lines.append("Recurring characters:\n" + "\n".join(f"- {c}" for c in self.characters))
+        if self.settings:
+            lines.append("Places:\n" + "\n".join(f"- {s}" for s in self.settings))
+        if self.lessons:
+            lines.append("Lessons already covered (build on them, do not repeat them): " + "; ".join(self.lessons))
+        if self.recent:
+            lines.append("Latest episodes:\n" + "\n".join(f"- {r}" for r in self.recent))
+        return "\n".join(lines)
+
+
+def build_series_prompt(
+    user_request: str,
+    length_choice: str,
+    arc_choice: str,
+    category: str,
+    bible: StoryBible,
+) -> tuple[str, str]:
+    """
+    The storyteller prompt plus the series bible, so the next episode stays consistent
+    with earlier nights without re-sending their text.
+    """
+    system_prompt, user_prompt = build_storyteller_prompt(user_request, length_choice, arc_choice, category)
+    context = bible.render()
+    if not context:
+        return (system_prompt, user_prompt)
+
+    system_prompt += f"""
+
+This story is the next episode of an ongoing series read over several nights.
+Keep the recurring characters, their names and personalities, and the places consistent with the series bible.
+The episode must still be complete on its own.
+
+Series bible:
+{context}"""
+    user_prompt += f"\nThis is episode {bible.episodes + 1} of the series."
+    return (system_prompt, user_prompt)
+
+
+def generate_series_episode(user_request: str, length_choice: str, arc_choice: str, category: str,
+                            bible: StoryBible, temperature: float = 0.85) -> str:
+    """Draft the next episode of a series."""
+    system_prompt, user_prompt = build_series_prompt(user_request, length_choice, arc_choice, category, bible)
+    return call_model(system_prompt, user_prompt, max_tokens=1500, temperature=temperature)
+
+
+def build_bible_update_prompt(bible: StoryBible, story: str, arc_choice: str) -> tuple[str, str]:
+    system_prompt = f"""You maintain the story bible of a children's bedtime story series.
+Merge the new episode into the bible and return ONLY a JSON object with these keys:
+- "characters": list of recurring characters, each as "Name - one short description" (at most {MAX_CHARACTERS}, most important first)
+- "settings": list of recurring places, each a short phrase (at most {MAX_SETTINGS})
+- "lesson": the lesson of the new episode in a few words
+- "summary": one sentence summarizing the new episode
+- "synopsis": the whole series so far in at most {MAX_SYNOPSIS_WORDS} words
+
+Drop minor one-off details so the bible stays short."""
+
+    user_prompt = f"""Current bible (JSON):
+{json.dumps(bible.to_dict(), ensure_ascii=False)}
+
+Parent-intent arc of the new episode: {arc_choice}
+
+New episode:
+\"\"\"{story}\"\"\""""
+    return (system_prompt, user_prompt)
+
+
+def _parse_bible_update(response: str) -> Dict:
+    start, end = response.find("{"), response.rfind("}")
+    if start == -1 or end <= start:
+        return {}
+    try:
+        data = json.loads(response[start:end + 1])
+    except json.JSONDecodeError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def summarize_episode(bible: StoryBible, story: str, arc_choice: str) -> StoryBible:
+    """
+    Fold a new episode into the bible with one low-temperature summarization call.
+    If the reply cannot be parsed, the bible still advances with the episode's arc and opening line.
+    """
+    system_prompt, user_prompt = build_bible_update_prompt(bible, story, arc_choice)
+    update = _parse_bible_update(call_model(system_prompt, user_prompt, max_tokens=500, temperature=0.2))
+
+    episode = bible.episodes + 1
+    lesson = str(update.get("lesson") or arc_choice.replace("_", " "))
+    summary = str(update.get("summary") or story.strip().split("\n")[0])
+    characters = update.get("characters") if isinstance(update.get("characters"), list) else []
+    settings = update.get("settings") if isinstance(update.get("settings"), list) else []
+    return StoryBible(
+        bible.series,
+        episode,
+        characters + bible.characters,
+        settings + bible.settings,
+        bible.lessons + [lesson],
+        str(update.get("synopsis") or bible.synopsis),
+        bible.recent + [f"Episode {episode}: {summary}"],
+    )
+
+
+class SeriesStore(SQLiteStore):
+    """
+    Series bibles in SQLite, plus a cache of bible updates keyed by (bible, episode) hashes,
+    so re-running or retrying an episode never pays for the summarization twice.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path, SCHEMA)
+        self._series_locks: Dict[str, threading.Lock] = {}
+        self._series_locks_lock = threading.Lock()
+
+    def load(self, series: str) -> StoryBible:
+        """The series bible, or an empty one for a new series."""
+        row = self._conn().execute("SELECT bible FROM series WHERE name = ?", (series,)).fetchone()
+        return StoryBible.from_dict(json.loads(row[0])) if row else StoryBible(series)
+
+    def lock(self, series: str) -> threading.Lock:
+        """
+        The lock that serializes episodes of one series in this process: hold it from load() to
+        save() so two concurrent episodes never start from the same bible.
+        """
+        with self._series_locks_lock:
+            return self._series_locks.setdefault(series, threading.Lock())
+
+    def save(self, bible: StoryBible):
+        """
+        Save the bible of the episode just written, as a compare-and-swap on the episode count:
+        raises SeriesConflict if another process saved that episode first.
+        """
+        data = json.dumps(bible.to_dict(), ensure_ascii=False)
+        conn = self._conn()
+        if bible.episodes == 1:
+            saved = conn.execute(
+                "INSERT OR IGNORE INTO series (name, updated, bible) VALUES (?, ?, ?)",
+                (bible.series, time.time(), data),
+            ).rowcount
+        else:
+            saved = conn.execute(
+                "UPDATE series SET updated = ?, bible = ? WHERE name = ? AND json_extract(bible, '$.episodes') = ?",
+                (time.time(), data, bible.series, bible.episodes - 1),
+            ).rowcount
+        if not saved:
+            raise SeriesConflict(
+                f"Episode {bible.episodes} of series '{bible.series}' was already saved by another writer"
+            )
+
+    def names(self) -> List[str]:
+        return [row[0] for row in self._conn().execute("SELECT name FROM series ORDER BY updated DESC")]
+
+    def update_bible(self, bible: StoryBible, story: str, arc_choice: str) -> StoryBible:
+        """summarize_episode, memoized by (bible fingerprint, story hash, arc)."""
+        story_hash = hashlib.sha256(story.encode("utf-8")).hexdigest()
+        key = f"{bible.fingerprint()}:{story_hash}:{arc_choice}"
+        row = self._conn().execute("SELECT bible FROM bible_updates WHERE key = ?", (key,)).fetchone()
+        if row:
+            return StoryBible.from_dict(json.loads(row[0]))
+        updated = summarize_episode(bible, story, arc_choice)
+        self._conn().execute(
+            "INSERT OR REPLACE INTO bible_updates (key, bible) VALUES (?, ?)",
+            (key, json.dumps(updated.to_dict(), ensure_ascii=False)),
+        )
+        return updated
+
+
+_store: Optional[SeriesStore] = None
+_store_lock = threading.Lock()
+
+
+def get_series_store() -> SeriesStore:
+    """Return the process-wide series store, opened on first use at STORY_SERIES_PATH (default story_series.db)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SeriesStore(os.getenv("STORY_SERIES_PATH", "story_series.db").strip() or "story_series.db")
+    return _store
+
+
+if __name__ == "__main__":
+    import sys
+
+    store = get_series_store()
+    if len(sys.argv) > 1:
+        print(store.load(sys.argv[1]).render() or f"No episodes yet in series '{sys.argv[1]}'.")
+    else:
+        for name in store.names():
+            print(name)